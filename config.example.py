@@ -46,3 +46,11 @@ LEARNER_CHANNEL_IDS = {
 # Astronomy util API keys
 N2YO_API_KEY = None
 TOMTOM_API_KEY = None
+
+# Outbound HTTP (shared session used for image fetches, APIs, etc.)
+HTTP_LIMIT_PER_HOST = 10  # max simultaneous connections to any one host
+HTTP_DNS_CACHE_TTL = 300  # seconds
+HTTP_KEEPALIVE_TIMEOUT = 30  # seconds an idle connection is kept open for reuse
+HTTP_TOTAL_TIMEOUT = 30  # seconds, whole request
+HTTP_CONNECT_TIMEOUT = 10  # seconds
+HTTP_READ_TIMEOUT = 15  # seconds between chunks
@@ -1,6 +1,7 @@
 import logging
-from typing import Any, List, Union
+from typing import Any, Dict, List, Union
 
+import aiohttp
 import discord
 from discord.ext import commands
 from discord.ext.commands import Paginator
@@ -8,12 +9,13 @@ from discord.ext.commands import Paginator
 from config import ADMIN_USER_IDS, BANNED_GUILD_IDS, DM_LOG_CHANNEL_ID, LEARNER_CHANNEL_IDS, LEARNER_USER_IDS
 from crimsobot import db
 from crimsobot.context import CrimsoContext
-from crimsobot.data.img import CAPTION_RULES, IMAGE_RULES
-from crimsobot.exceptions import (BadCaption, LocationNotFound, NoImageFound, NoMatchingTarotCard,
-                                  NotDirectMessage, StrictInputFailed, ZoomNotValid)
+from crimsobot.data.img import CAPTION_RULES, IMAGE_RULES, warm_emoji_lut
+from crimsobot.exceptions import (BadCaption, ImageTooLarge, LocationNotFound, NoImageFound, NoMatchingTarotCard,
+                                  NotDirectMessage, StrictInputFailed, WorkersBusy, ZoomNotValid)
 from crimsobot.help_command import PaginatedHelpCommand
 from crimsobot.models.ban import Ban
-from crimsobot.utils import markov as m, tools as c
+from crimsobot.utils import image as imagetools, markov as m, net, tools as c
+from crimsobot.utils.assets import emoji_index, warm_assets
 
 
 class CrimsoBOT(commands.Bot):
@@ -46,6 +48,8 @@ class CrimsoBOT(commands.Bot):
         )
 
         self.banned_user_ids = []  # type: List[int]
+        self.http_session: aiohttp.ClientSession  # created in start(), since it has to be bound to the running loop
+        self.markov_cache: Dict[str, m.CachedMarkov] = {}  # filled in start()
 
         self.log = logging.getLogger(__name__)
         self._extensions_to_load = [
@@ -76,6 +80,8 @@ class CrimsoBOT(commands.Bot):
                 self.log.error('%s cannot be reloaded: %s', name, error)
 
     async def start(self, *args: Any, **kwargs: Any) -> None:
+        # first, so that close() has a session to close even if anything after this fails
+        self.http_session = net.create_session()
         await db.connect()
 
         banned_user_ids = await Ban.filter(active=True).values_list(
@@ -85,12 +91,24 @@ class CrimsoBOT(commands.Bot):
         self.banned_user_ids = banned_user_ids
         self.markov_cache = await m.initialize_markov()
 
+        # decode overlay assets, index the emoji and spin up the image workers (which decode their own copies) before
+        # taking commands
+        warm_assets()
+        emoji_index.warm()
+        warm_emoji_lut()
+        await imagetools.image_pool.warm()
+
         m.update_models.start(self)
         await super().start(*args, **kwargs)
 
     async def close(self) -> None:
         await super().close()
         await db.close()
+        await self.http_session.close()
+        imagetools.image_pool.shutdown()
+        m.markov_pool.shutdown()
+        for model in self.markov_cache.values():
+            model.stop()
 
         if m.update_models.is_running():
             m.update_models.cancel()
@@ -164,6 +182,19 @@ class CrimsoBOT(commands.Bot):
                 traceback_needed = False
                 msg_to_user = f'Caption most be between 1-{CAPTION_RULES["max_len"]} alphanumeric characters.'
 
+            if isinstance(error.original, ImageTooLarge):
+                error_type = '**TOO BIG**'
+                traceback_needed = False
+                msg_to_user = f'That image is too big to process: {error.original.reason}.'
+
+            if isinstance(error.original, WorkersBusy):
+                error_type = '**TOO BUSY**'
+                traceback_needed = False
+                msg_to_user = (
+                    f"I'm already working on {error.original.pending} images! "
+                    'Give me a minute and try again.'
+                )
+
         elif isinstance(error, commands.MissingRequiredArgument):
             error_type = 'MISSING ARGUMENT'
             msg_to_user = f'This command requires more arguments. Try `>help {ctx.command.qualified_name}`'
@@ -9,7 +9,7 @@ from config import ADMIN_USER_IDS, PERMISSIONS_INTEGER
 from crimsobot.bot import CrimsoBOT
 from crimsobot.models.ban import Ban
 from crimsobot.models.user import User
-from crimsobot.utils import tools as c
+from crimsobot.utils import image as imagetools, tools as c
 
 log = logging.getLogger(__name__)
 
@@ -183,6 +183,32 @@ class Admin(commands.Cog):
         self.bot.reload_extensions()
         log.info('All extensions have been reloaded.')
 
+    @commands.command(hidden=True, aliases=['cachestats'])
+    @commands.is_owner()
+    async def imagestats(self, ctx: commands.Context) -> None:
+        """Counters for the image caches, scheduler, worker pool and render timings."""
+
+        sections = {
+            'Image fetch cache': imagetools.fetch_cache.stats(),
+            'Image render cache': imagetools.render_cache.stats(),
+            'Image scheduler': imagetools.image_scheduler.stats(),
+            'Image workers': imagetools.image_pool.stats(),
+            'Image render timings': imagetools.render_estimator.stats(),
+        }
+
+        for title, stats in sections.items():
+            stat_string = '\n'.join(f'{name}: {value}' for name, value in stats.items())
+            await ctx.send(f'**{title}**\n```{stat_string}```')
+
+    @commands.command(hidden=True)
+    @commands.is_owner()
+    async def markovstats(self, ctx: commands.Context) -> None:
+        """Build and swap metrics for each Markov model."""
+
+        for name, model in self.bot.markov_cache.items():
+            stat_string = '\n'.join(f'{stat}: {value}' for stat, value in model.stats().items())
+            await ctx.send(f'**Markov model: {name}**\n```{stat_string}```')
+
 
 def setup(bot: CrimsoBOT) -> None:
     bot.add_cog(Admin(bot))
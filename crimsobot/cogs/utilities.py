@@ -283,7 +283,7 @@ class Utilities(commands.Cog):
         """
 
         location = location.upper()
-        lat, lon, url, passes = await astronomy.get_iss_loc(location)
+        lat, lon, url, passes = await astronomy.get_iss_loc(self.bot.http_session, location)
         if not url:
             raise LocationNotFound(location)
 
@@ -1,8 +1,10 @@
+import functools
 from typing import List, Tuple
 
+import numpy as np
 import yaml
 
-from crimsobot.utils.color import LabColor, get_nearest_color, hex_to_lab, hex_to_rgb
+from crimsobot.utils.color import LabColor, hex_to_lab, hex_to_rgb, nearest_colors, rgb_to_lab
 from crimsobot.utils.tools import clib_path_join
 
 
@@ -13,13 +15,24 @@ with open(_ruleset_path, encoding='utf-8', errors='ignore') as rules_file:
 # these are what should be imported by other scripts
 IMAGE_RULES = _ruleset['image']
 URL_CONTAINS = IMAGE_RULES['url_contains']
+FETCH_CACHE_RULES = IMAGE_RULES['fetch_cache']
+RENDER_CACHE_RULES = IMAGE_RULES['render_cache']
+ESTIMATE_RULES = IMAGE_RULES['estimate']
+FIT_RULES = IMAGE_RULES['fit']
+
+WORKER_RULES = _ruleset['workers']
+
+SCHEDULER_RULES = _ruleset['scheduler']
 
 GIF_RULES = _ruleset['gif']
 
+PALETTE_RULES = _ruleset['palette']
+
 CAPTION_RULES = _ruleset['caption']
 
 _EIMG_RULES = _ruleset['eimg']
 EIMG_WIDTH = _EIMG_RULES['width']
+EIMG_OVERSAMPLE = _EIMG_RULES['oversample']
 
 AENIMA = _ruleset['aenima']
 AEROPLANE = _ruleset['aeroplane']
@@ -33,7 +46,7 @@ LATERALUS = _ruleset['lateralus']
 color_dict = _EIMG_RULES['palette']
 rgb_color_list = []  # type: List[Tuple[int, int, int]]
 
-# this is used internally for the color search in lookup_emoji() below
+# this is used internally for the emoji lookup table below
 _lab_color_list = []  # type: List[LabColor]
 
 for color in color_dict:
@@ -41,14 +54,39 @@ for color in color_dict:
     rgb_color_list.append(hex_to_rgb(hex_color))
     _lab_color_list.append(hex_to_lab(hex_color))
 
+_palette_lab = np.array([lab_color.get_value_tuple() for lab_color in _lab_color_list])
+
+# RGB -> emoji lookup table for whole images: each channel is cut down to _LUT_BITS bits, and every cell of the
+# resulting cube holds the index (into emoji_list) of the palette color nearest the cell's center by CIEDE2000
+_LUT_BITS = 5
+_LUT_SHIFT = 8 - _LUT_BITS
+
+emoji_list = list(color_dict.values())  # type: List[str]
+
+
+@functools.lru_cache(maxsize=None)
+def _emoji_lut() -> np.ndarray:
+    # not built at import, since it takes a moment and worker processes never need it; see warm_emoji_lut()
+    levels = 1 << _LUT_BITS
+    centers = (np.arange(levels) << _LUT_SHIFT) + (1 << _LUT_SHIFT) // 2
+    grid = np.stack(np.meshgrid(centers, centers, centers, indexing='ij'), axis=-1)  # (r, g, b, RGB)
+
+    nearest = nearest_colors(rgb_to_lab(grid).reshape(-1, 3), _palette_lab)
+
+    lut = nearest.astype(np.uint8).reshape(levels, levels, levels)  # type: np.ndarray
+    return lut
+
+
+def warm_emoji_lut() -> None:
+    """Build the emoji lookup table now, so the first >eimg doesn't stall the event loop building it."""
+
+    _emoji_lut()
 
-def lookup_emoji(hex_in: str) -> str:
-    """search (bc quantizing palette not working)"""
 
-    nearest = get_nearest_color(_lab_color_list, hex_in)
+def lookup_emoji_indices(rgb: np.ndarray) -> np.ndarray:
+    """Index (into emoji_list) of the nearest emoji for each pixel of an (..., 3) uint8 RGB array."""
 
-    for key, value in color_dict.items():  # type: str, str
-        if nearest == key:
-            return value
+    shifted = rgb >> _LUT_SHIFT
+    indices = _emoji_lut()[shifted[..., 0], shifted[..., 1], shifted[..., 2]]  # type: np.ndarray
 
-    return 'F'  # failure to find emoji
+    return indices
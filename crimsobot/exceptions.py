@@ -38,3 +38,13 @@ class NoEmojiFound(Exception):
 
 class BadCaption(Exception):
     pass
+
+
+class ImageTooLarge(Exception):
+    def __init__(self, reason: str) -> None:
+        self.reason = reason
+
+
+class WorkersBusy(Exception):
+    def __init__(self, pending: int) -> None:
+        self.pending = pending
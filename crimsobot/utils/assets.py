@@ -0,0 +1,143 @@
+import collections
+import os
+import threading
+from typing import Dict, Iterable, Optional, Tuple
+
+from PIL import Image
+
+from crimsobot.utils import tools as c
+
+# (asset filename, size or None for original size, rotation in degrees, mode)
+VariantKey = Tuple[str, Optional[Tuple[int, int]], int, str]
+
+
+class AssetRegistry:
+    """Overlay and template images from data/img, decoded and resized once per process. Call .copy() before drawing."""
+
+    def __init__(self, filenames: Iterable[str], max_variants: int = 64) -> None:
+        self.filenames = tuple(filenames)
+        self.max_variants = max_variants
+
+        self._originals = {}  # type: Dict[str, Image.Image]
+        self._variants = collections.OrderedDict()  # type: collections.OrderedDict[VariantKey, Image.Image]
+        self._lock = threading.Lock()  # in 'thread' worker mode, several frames can be rendering at once
+
+    def _load(self, filename: str) -> Image.Image:
+        # the lock is held by the caller
+        original = self._originals.get(filename)
+        if original is None:
+            with Image.open(c.clib_path_join('img', filename)) as asset:
+                original = asset.convert('RGBA')  # convert() also forces the decode, so the file can be closed
+            self._originals[filename] = original
+
+        return original
+
+    def get(self, filename: str, size: Optional[Tuple[int, int]] = None, rotation: int = 0,
+            mode: str = 'RGBA') -> Image.Image:
+        """Get an asset, optionally resized (bicubic), then rotated, then converted to another mode."""
+
+        with self._lock:
+            if size is None and rotation == 0 and mode == 'RGBA':
+                return self._load(filename)
+
+            key = (filename, size, rotation, mode)  # type: VariantKey
+            variant = self._variants.get(key)
+            if variant is not None:
+                self._variants.move_to_end(key)
+                return variant
+
+            variant = self._load(filename)
+            if size is not None:
+                variant = variant.resize(size, resample=Image.BICUBIC)
+            if rotation:
+                variant = variant.rotate(rotation)
+            if mode != 'RGBA':
+                variant = variant.convert(mode)
+
+            self._variants[key] = variant
+            while len(self._variants) > self.max_variants:
+                self._variants.popitem(last=False)
+
+            return variant
+
+    def warm(self) -> None:
+        """Decode every asset now rather than on first use."""
+
+        with self._lock:
+            for filename in self.filenames:
+                self._load(filename)
+
+
+assets = AssetRegistry([
+    'aenima_cover.png',
+    'aeroplane_cover.png',
+    'ban.png',
+    'currents_back.png',
+    'currents_front.png',
+    'damn.png',
+    'fishe_on_head.png',
+    'lateralus_back.png',
+    'lateralus_wordmark.png',
+    'roundping.png',
+    'roundping_buffer.png',
+    'the_bends.png',
+    'xokked_base.png',
+])
+
+
+def codepoints(text: str) -> str:
+    """A string's code points as dash-separated lowercase hex, the way Twemoji names its files (e.g. 1f1fa-1f1f8)."""
+
+    return '-'.join(format(ord(character), 'x') for character in text)
+
+
+class EmojiIndex:
+    """Twemoji PNGs in one directory, found by code point sequence without touching the filesystem per lookup."""
+
+    VARIATION_SELECTOR = '-fe0f'
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+
+        self._paths = None  # type: Optional[Dict[str, str]]
+        self._lock = threading.Lock()
+
+    @classmethod
+    def _strip(cls, sequence: str) -> str:
+        return sequence.replace(cls.VARIATION_SELECTOR, '')
+
+    def _index(self) -> Dict[str, str]:
+        with self._lock:
+            if self._paths is None:
+                stems = sorted(name[:-4] for name in os.listdir(self.directory) if name.endswith('.png'))
+
+                # Discord and Twemoji don't always agree on where U+FE0F goes, so every file is also indexed without it
+                paths = {stem: os.path.join(self.directory, stem + '.png') for stem in stems}
+                for stem in stems:
+                    paths.setdefault(self._strip(stem), paths[stem])  # exact names win
+
+                self._paths = paths
+
+            return self._paths
+
+    def find(self, emoji: str) -> Optional[str]:
+        """Path to the PNG for an emoji, or None if there isn't one."""
+
+        paths = self._index()
+        sequence = codepoints(emoji)
+
+        return paths.get(sequence) or paths.get(self._strip(sequence))
+
+    def warm(self) -> None:
+        """List the directory now rather than on first use."""
+
+        self._index()
+
+
+emoji_index = EmojiIndex(c.clib_path_join('emoji'))
+
+
+def warm_assets() -> None:
+    """assets.warm() as a plain function, which (unlike the bound method) can be handed to worker processes."""
+
+    assets.warm()
@@ -36,7 +36,10 @@ def where_are_you(location: str) -> Optional[Location]:
     return geolocator.geocode(location)
 
 
-async def get_iss_loc(query: str) -> Tuple[Optional[float], Optional[float], Optional[str], List[ISSPass]]:
+async def get_iss_loc(
+    session: aiohttp.ClientSession,
+    query: str
+) -> Tuple[Optional[float], Optional[float], Optional[str], List[ISSPass]]:
     location = where_are_you(query)
     if not location:
         return None, None, None, []
@@ -46,10 +49,9 @@ async def get_iss_loc(query: str) -> Tuple[Optional[float], Optional[float], Opt
 
     url = 'https://www.heavens-above.com/PassSummary.aspx?satid=25544&lat={}&lng={}'.format(lat, lon)
 
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url) as response:
-            text = await response.text()
-            tree = html.fromstring(text.strip('Â'))
+    async with session.get(url) as response:
+        text = await response.text()
+        tree = html.fromstring(text.strip('Â'))
 
     prefix = '/html/body/form/table/tr[3]/td[1]/table[3]/tr'
     rows = []
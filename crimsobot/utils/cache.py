@@ -0,0 +1,317 @@
+import collections
+import hashlib
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+from crimsobot.utils import tools as c
+
+# disk space budgeted per alias that ContentCache keeps on disk: a timestamp and a content hash
+ALIAS_RECORD_BYTES = 96
+
+
+def content_hash(data: bytes) -> str:
+    """Hex digest used to address cached content. Always safe to use as a filename."""
+
+    return hashlib.sha256(data).hexdigest()
+
+
+# for whole uploads, which can take long enough to hash that it shouldn't happen on the event loop
+async_content_hash = c.executor_function(content_hash)
+
+
+class ByteCache:
+    """In-memory LRU cache of bytes, bounded by the total size of its values rather than by entry count."""
+
+    def __init__(self, max_bytes: int, ttl: Optional[float] = None) -> None:
+        self.max_bytes = max_bytes
+        self.ttl = ttl  # seconds; None means entries only leave by eviction
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.current_bytes = 0
+
+        self._entries = collections.OrderedDict()  # type: collections.OrderedDict[str, Tuple[float, bytes]]
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[bytes]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        stored_at, data = entry
+        if self.ttl is not None and time.monotonic() - stored_at > self.ttl:
+            self._remove(key)
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        # something bigger than the whole budget would just evict everything else and then itself
+        if len(data) > self.max_bytes:
+            return
+
+        if key in self._entries:
+            self._remove(key)
+
+        self._entries[key] = (time.monotonic(), data)
+        self.current_bytes += len(data)
+
+        while self.current_bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key: str) -> None:
+        _, data = self._entries.pop(key)
+        self.current_bytes -= len(data)
+
+
+class DiskByteCache:
+    """Bytes stored as files in one directory, bounded by total size. Keys must be safe filenames (i.e. hex digests)."""
+
+    def __init__(self, directory: str, max_bytes: int) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        os.makedirs(self.directory, exist_ok=True)
+        self.current_bytes = sum(size for _, size, _ in self._scan())
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def _scan(self) -> List[Tuple[float, int, str]]:
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.startswith('.'):  # leave .gitignore alone
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        return entries
+
+    @c.executor_function
+    def get(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+
+        os.utime(path)  # mark as recently used; _cleanup() deletes the oldest mtimes first
+        self.hits += 1
+
+        return data
+
+    @c.executor_function
+    def put(self, key: str, data: bytes, replace: bool = False) -> None:
+        """Store data under key. An existing file is only marked as used, unless replace is set."""
+
+        if len(data) > self.max_bytes:
+            return
+
+        path = self._path(key)
+        if os.path.exists(path):
+            if not replace:  # a key that's a content hash always holds the same data
+                os.utime(path)
+                return
+
+            self.current_bytes -= os.path.getsize(path)
+
+        # write-then-rename so a half-written file is never read back as a hit
+        temp_path = f'{path}.{os.getpid()}.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+        self.current_bytes += len(data)
+        if self.current_bytes > self.max_bytes:
+            self._cleanup()
+
+    def _cleanup(self) -> None:
+        """Delete least recently used files until the directory is back under budget."""
+
+        entries = sorted(self._scan())
+        self.current_bytes = sum(size for _, size, _ in entries)
+
+        for _, size, path in entries:
+            if self.current_bytes <= self.max_bytes:
+                break
+
+            try:
+                os.remove(path)
+            except FileNotFoundError:  # another shard sharing the directory got to it first
+                pass
+
+            self.current_bytes -= size
+            self.evictions += 1
+
+
+class TieredCache:
+    """Bytes under caller-chosen keys, kept in memory and (if given a directory) on disk as well."""
+
+    def __init__(self, max_bytes: int, directory: Optional[str] = None, disk_max_bytes: int = 0) -> None:
+        self.memory = ByteCache(max_bytes)
+        self.disk = DiskByteCache(directory, disk_max_bytes) if directory else None
+
+    async def get(self, key: str) -> Optional[bytes]:
+        data = self.memory.get(key)
+        if data is None and self.disk is not None:
+            data = await self.disk.get(key)
+            if data is not None:
+                self.memory.put(key, data)  # promote
+
+        return data
+
+    async def put(self, key: str, data: bytes, persist: bool = True) -> None:
+        """Store data under key. Set persist to False to keep it out of the disk tier."""
+
+        if key in self.memory:
+            return
+
+        self.memory.put(key, data)
+        if persist and self.disk is not None:
+            await self.disk.put(key, data)
+
+    def stats(self) -> Dict[str, int]:
+        stats = {
+            'memory_entries': len(self.memory),
+            'memory_bytes': self.memory.current_bytes,
+            'memory_hits': self.memory.hits,
+            'memory_misses': self.memory.misses,
+            'memory_evictions': self.memory.evictions,
+        }
+
+        if self.disk is not None:
+            stats.update({
+                'disk_bytes': self.disk.current_bytes,
+                'disk_hits': self.disk.hits,
+                'disk_misses': self.disk.misses,
+                'disk_evictions': self.disk.evictions,
+            })
+
+        return stats
+
+
+class ContentCache:
+    """Content-addressed cache with an optional on-disk tier, found through aliases such as normalized URLs."""
+
+    def __init__(self, max_bytes: int, ttl: float, max_aliases: int,
+                 directory: Optional[str] = None, disk_max_bytes: int = 0) -> None:
+        self.ttl = ttl  # for aliases, since what's behind a URL can change; content itself never goes stale
+        self.max_aliases = max_aliases
+        self.store = TieredCache(max_bytes, directory, disk_max_bytes)
+        # aliases go on disk too, so content on disk can still be found by them after a restart
+        self.alias_disk = DiskByteCache(
+            os.path.join(directory, 'aliases'), max_aliases * ALIAS_RECORD_BYTES
+        ) if directory else None
+
+        self.hits = 0
+        self.misses = 0
+
+        self._aliases = collections.OrderedDict()  # type: collections.OrderedDict[str, Tuple[float, str]]
+
+    def _remember(self, alias: str, stored_at: float, key: str) -> None:
+        self._aliases[alias] = (stored_at, key)
+        self._aliases.move_to_end(alias)
+        while len(self._aliases) > self.max_aliases:
+            self._aliases.popitem(last=False)
+
+    async def _load_alias(self, alias: str) -> Optional[Tuple[float, str]]:
+        """Read an alias back from disk, into memory."""
+
+        assert self.alias_disk is not None
+        record = await self.alias_disk.get(content_hash(alias.encode()))
+        if record is None:
+            return None
+
+        try:
+            stored_at, key = record.decode().split()
+            age = time.time() - float(stored_at)  # wall-clock time on disk, since monotonic time starts over
+        except ValueError:
+            return None
+
+        entry = (time.monotonic() - age, key)
+        self._remember(alias, *entry)
+
+        return entry
+
+    async def resolve(self, alias: str) -> Optional[str]:
+        """Return the content hash an alias points to, if the alias is known and not expired."""
+
+        entry = self._aliases.get(alias)
+        if entry is None and self.alias_disk is not None:
+            entry = await self._load_alias(alias)
+        if entry is None:
+            return None
+
+        stored_at, key = entry
+        if time.monotonic() - stored_at > self.ttl:
+            del self._aliases[alias]
+            return None
+
+        self._aliases.move_to_end(alias)
+
+        return key
+
+    async def get(self, alias: str) -> Optional[bytes]:
+        key = await self.resolve(alias)
+        data = await self.get_content(key) if key else None
+
+        if data is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+        return data
+
+    async def get_content(self, key: str) -> Optional[bytes]:
+        """Look up content directly by its hash."""
+
+        return await self.store.get(key)
+
+    async def put(self, alias: Optional[str], data: bytes, persist: bool = True) -> str:
+        """Store data and point alias at it. Set persist to False for things that are already on local disk."""
+
+        key: str = await async_content_hash(data)
+        await self.store.put(key, data, persist)
+
+        if alias is not None:
+            self._remember(alias, time.monotonic(), key)
+            if persist and self.alias_disk is not None:
+                record = f'{time.time():.3f} {key}'.encode()
+                await self.alias_disk.put(content_hash(alias.encode()), record, replace=True)
+
+        return key
+
+    def stats(self) -> Dict[str, int]:
+        stats = {
+            'hits': self.hits,
+            'misses': self.misses,
+            'aliases': len(self._aliases),
+        }
+        stats.update(self.store.stats())
+
+        if self.alias_disk is not None:
+            stats.update({
+                'disk_alias_bytes': self.alias_disk.current_bytes,
+                'disk_alias_hits': self.alias_disk.hits,
+            })
+
+        return stats
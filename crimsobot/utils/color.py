@@ -1,7 +1,7 @@
 from typing import Sequence, Tuple
 
+import numpy as np
 from colormath.color_conversions import convert_color
-from colormath.color_diff import delta_e_cie2000
 from colormath.color_objects import LabColor, sRGBColor
 
 
@@ -13,19 +13,109 @@ def hex_to_rgb(color: str) -> Tuple[int, int, int]:
     return r, g, b
 
 
+# sRGB (D65) to XYZ, as used by colormath
+_RGB_TO_XYZ = np.array([
+    [0.412424, 0.357579, 0.180464],
+    [0.212656, 0.715158, 0.0721856],
+    [0.0193324, 0.119193, 0.950444],
+])
+_D65_WHITE = np.array([0.95047, 1.0, 1.08883])
+_CIE_E = 216 / 24389
+
+
+def rgb_to_lab(rgb: np.ndarray) -> np.ndarray:
+    """Convert an array of 0-255 sRGB colors (last axis R, G, B) to CIE Lab under D65, as colormath does."""
+
+    channels = np.asarray(rgb, dtype=np.float64) / 255
+    linear = np.where(channels <= 0.04045, channels / 12.92, ((channels + 0.055) / 1.055) ** 2.4)
+
+    xyz = linear @ _RGB_TO_XYZ.T / _D65_WHITE
+    f = np.where(xyz > _CIE_E, np.cbrt(xyz), 7.787 * xyz + 16 / 116)
+
+    lab = np.empty_like(f)  # type: np.ndarray
+    lab[..., 0] = 116 * f[..., 1] - 16
+    lab[..., 1] = 500 * (f[..., 0] - f[..., 1])
+    lab[..., 2] = 200 * (f[..., 1] - f[..., 2])
+
+    return lab
+
+
 def hex_to_lab(base: str) -> LabColor:
-    r, g, b = hex_to_rgb(base)
+    lab_l, lab_a, lab_b = rgb_to_lab(np.array(hex_to_rgb(base)))
+
+    return LabColor(lab_l, lab_a, lab_b, illuminant='d65')
+
+
+def delta_e_cie2000(lab_1: np.ndarray, lab_2: np.ndarray) -> np.ndarray:
+    """CIEDE2000 color difference between two arrays of Lab colors (last axis L, a, b), broadcast against each other."""
+
+    # as in Sharma, Wu & Dalal (2005), with k_L = k_C = k_H = 1
+    l_1, a_1, b_1 = np.moveaxis(np.asarray(lab_1, dtype=np.float64), -1, 0)
+    l_2, a_2, b_2 = np.moveaxis(np.asarray(lab_2, dtype=np.float64), -1, 0)
+
+    # a* is stretched according to how colorful the pair is on average
+    c_mean = (np.hypot(a_1, b_1) + np.hypot(a_2, b_2)) / 2
+    g = 0.5 * (1 - np.sqrt(c_mean ** 7 / (c_mean ** 7 + 25 ** 7)))
+    c_1 = np.hypot((1 + g) * a_1, b_1)
+    c_2 = np.hypot((1 + g) * a_2, b_2)
+    h_1 = np.degrees(np.arctan2(b_1, (1 + g) * a_1)) % 360
+    h_2 = np.degrees(np.arctan2(b_2, (1 + g) * a_2)) % 360
+
+    # differences in lightness, chroma and hue; hue doesn't count where either color is neutral
+    chromatic = (c_1 * c_2) != 0
+    dh = h_2 - h_1
+    dh = np.where(dh > 180, dh - 360, np.where(dh < -180, dh + 360, dh))
+    dh = np.where(chromatic, dh, 0)
+    delta_l = l_2 - l_1
+    delta_c = c_2 - c_1
+    delta_h = 2 * np.sqrt(c_1 * c_2) * np.sin(np.radians(dh) / 2)
+
+    # means, with the mean hue taken the short way around the circle
+    l_mean = (l_1 + l_2) / 2
+    c_mean = (c_1 + c_2) / 2
+    h_sum = h_1 + h_2
+    h_mean = np.where(np.abs(h_1 - h_2) <= 180, h_sum / 2, np.where(h_sum < 360, h_sum + 360, h_sum - 360) / 2)
+    h_mean = np.where(chromatic, h_mean, h_sum)
+
+    t = (
+        1
+        - 0.17 * np.cos(np.radians(h_mean - 30))
+        + 0.24 * np.cos(np.radians(2 * h_mean))
+        + 0.32 * np.cos(np.radians(3 * h_mean + 6))
+        - 0.20 * np.cos(np.radians(4 * h_mean - 63))
+    )
+    s_l = 1 + 0.015 * (l_mean - 50) ** 2 / np.sqrt(20 + (l_mean - 50) ** 2)
+    s_c = 1 + 0.045 * c_mean
+    s_h = 1 + 0.015 * c_mean * t
+    r_t = (
+        -2 * np.sqrt(c_mean ** 7 / (c_mean ** 7 + 25 ** 7))
+        * np.sin(np.radians(60 * np.exp(-(((h_mean - 275) / 25) ** 2))))
+    )
+
+    delta_e = np.sqrt(
+        (delta_l / s_l) ** 2
+        + (delta_c / s_c) ** 2
+        + (delta_h / s_h) ** 2
+        + r_t * (delta_c / s_c) * (delta_h / s_h)
+    )  # type: np.ndarray
+
+    return delta_e
+
+
+def nearest_colors(lab_colors: np.ndarray, palette_lab: np.ndarray) -> np.ndarray:
+    """For each of N Lab colors (N x 3), the index of the closest of M palette colors (M x 3) by CIEDE2000."""
 
-    color_rgb = sRGBColor(r, g, b, is_upscaled=True)
-    color = convert_color(color_rgb, LabColor)
+    distances = delta_e_cie2000(np.asarray(lab_colors)[:, np.newaxis, :], np.asarray(palette_lab)[np.newaxis, :, :])
+    indices = distances.argmin(axis=1)  # type: np.ndarray
 
-    return color
+    return indices
 
 
 def get_nearest_color(lab_colors: Sequence[LabColor], rgb_color: str) -> str:
-    lab_color = hex_to_lab(rgb_color)
+    palette_lab = np.array([lab_color.get_value_tuple() for lab_color in lab_colors])
+    query_lab = rgb_to_lab(np.array([hex_to_rgb(rgb_color)]))
 
-    nearest = min(lab_colors, key=lambda fc: int(delta_e_cie2000(lab_color, fc)))
+    nearest = lab_colors[int(nearest_colors(query_lab, palette_lab)[0])]
     nearest = convert_color(nearest, sRGBColor)
 
     nearest_hex = nearest.get_rgb_hex()  # type: str
@@ -0,0 +1,95 @@
+import functools
+from io import BytesIO
+from typing import Dict, List, Tuple
+
+from PIL import ImageFont
+
+from crimsobot.utils import tools as c
+
+
+@functools.lru_cache(maxsize=None)
+def get_font(filename: str, size: int) -> ImageFont.FreeTypeFont:
+    """Load a font from data/img once per (file, size) and reuse it from then on."""
+
+    with open(c.clib_path_join('img', filename), 'rb') as f:
+        font_bytes = f.read()
+
+    return ImageFont.truetype(BytesIO(font_bytes), size)
+
+
+class GlyphMetrics:
+    """Text widths for one font, built up from per-character measurements that are each taken only once."""
+
+    def __init__(self, font: ImageFont.FreeTypeFont) -> None:
+        self.font = font
+        self._advances: Dict[str, int] = {}
+        self._extents: Dict[str, int] = {}
+
+    def advance(self, char: str) -> int:
+        advance = self._advances.get(char)
+        if advance is None:
+            advance = int(self.font.getlength(char))
+            self._advances[char] = advance
+
+        return advance
+
+    def extent(self, char: str) -> int:
+        extent = self._extents.get(char)
+        if extent is None:
+            extent = self.font.getsize(char)[0]
+            self._extents[char] = extent
+
+        return extent
+
+    def width(self, text: str) -> int:
+        if not text:
+            return 0
+
+        # the last character counts its full extent, since italic glyphs can hang past their advance; no kerning, so
+        # this can be off from font.getsize() by a pixel or two, which is fine for deciding where to wrap
+        return sum(self.advance(char) for char in text[:-1]) + self.extent(text[-1])
+
+
+@functools.lru_cache(maxsize=None)
+def get_metrics(filename: str, size: int) -> GlyphMetrics:
+    return GlyphMetrics(get_font(filename, size))
+
+
+def wrap_line(metrics: GlyphMetrics, line: str, max_width: int) -> List[Tuple[str, int]]:
+    """Greedily wrap a line to max_width at the last space where there is one. Returns (text, width) per line."""
+
+    wrapped = []  # type: List[Tuple[str, int]]
+
+    chars = []  # type: List[str]
+    advance_sum = 0  # sum of the advances of everything in chars
+    width = 0  # width of chars as drawn
+    last_space = -1  # index of the last space in chars
+    advance_to_space = 0  # sum of the advances of chars[:last_space + 1]
+
+    # a character is added as long as the text before it is narrower than max_width, so a line can overshoot by one
+    for char in line:
+        if width >= max_width:
+            if last_space >= 0:  # break at the last space; the space itself is dropped
+                head = ''.join(chars[:last_space])
+                wrapped.append((head, metrics.width(head)))
+                chars = chars[last_space + 1:]
+                advance_sum -= advance_to_space
+            else:  # no spaces for breaking
+                wrapped.append((''.join(chars), width))
+                chars = []
+                advance_sum = 0
+
+            last_space = -1  # what's left of the line is the last word, so it has no spaces
+
+        if char == ' ':
+            last_space = len(chars)
+            advance_to_space = advance_sum + metrics.advance(char)
+
+        chars.append(char)
+        advance_sum += metrics.advance(char)
+        width = advance_sum - metrics.advance(char) + metrics.extent(char)
+
+    # append final line (which, if followed by an image argument, will include a space)
+    wrapped.append((''.join(chars), width))
+
+    return wrapped
@@ -0,0 +1,391 @@
+import collections
+import dataclasses
+import functools
+import itertools
+import math
+import struct
+from io import BytesIO
+from typing import Any, BinaryIO, Iterable, Iterator, List, Optional, Sequence, Tuple, TypeVar
+
+import numpy as np
+from PIL import Image
+
+from crimsobot.data.img import GIF_RULES
+
+# palette index reserved for transparency; quantized frames only ever use indices 0-254 for colors
+TRANSPARENT = 255
+
+# a pixel at or below this alpha is transparent in the GIF
+ALPHA_THRESHOLD = 88
+
+# whatever rides along with each frame through Quantizer.stream(), e.g. its duration
+Tag = TypeVar('Tag')
+
+
+def alpha_mask(frame: Image.Image) -> np.ndarray:
+    """True wherever an RGBA frame will be transparent once it's a GIF frame."""
+
+    return np.asarray(frame.getchannel('A')) <= ALPHA_THRESHOLD
+
+
+@functools.lru_cache(maxsize=32)
+def _palette_image(colors: bytes) -> Image.Image:
+    """A 'P' image holding 255 colors, for Image.quantize(palette=...)."""
+
+    colors = colors[:765].ljust(765, b'\x00')
+
+    # entry 255 repeats entry 0, so a pixel that quantize() maps to it can simply be moved to 0 afterwards
+    palette_image = Image.new('P', (1, 1))
+    palette_image.putpalette(colors + colors[:3])
+
+    return palette_image
+
+
+def _sample_frames(frames: Sequence[Image.Image]) -> List[Image.Image]:
+    n_sampled = min(len(frames), GIF_RULES['palette_sample_frames'])
+    step = len(frames) / n_sampled
+
+    return [frames[int(i * step)] for i in range(n_sampled)]
+
+
+def build_palette(frames: Sequence[Image.Image]) -> bytes:
+    """Median-cut one 255-color palette from the opaque pixels of a sample of RGBA frames."""
+
+    pixels = []
+    for frame in _sample_frames(frames):
+        rgba = np.asarray(frame)
+        pixels.append(rgba[rgba[..., 3] > ALPHA_THRESHOLD][:, :3])
+
+    all_pixels = np.concatenate(pixels)
+    if len(all_pixels) == 0:
+        all_pixels = np.zeros((1, 3), dtype=np.uint8)
+
+    # an even spread of pixels is plenty to find the colors that matter
+    stride = -(-len(all_pixels) // GIF_RULES['palette_sample_pixels'])
+    sample = np.ascontiguousarray(all_pixels[::stride]).reshape(1, -1, 3)
+
+    quantized = Image.fromarray(sample, 'RGB').quantize(colors=255)
+
+    return bytes(quantized.getpalette()[:765])
+
+
+def _rms_error(rgb: np.ndarray, indices: np.ndarray, colors: bytes, opaque: np.ndarray) -> float:
+    """How far, on average, quantized pixels are from the originals (RMS over channels, opaque pixels only)."""
+
+    # every other pixel of every other row is plenty to tell a good fit from a bad one
+    rgb, indices, opaque = rgb[::2, ::2], indices[::2, ::2], opaque[::2, ::2]
+
+    palette = np.frombuffer(colors, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+    diff = rgb[opaque].astype(np.int32) - palette[indices[opaque]]
+
+    return float(np.sqrt(np.mean(diff * diff))) if diff.size else 0.0
+
+
+def _quantize_adaptive(rgb: Image.Image) -> Tuple[bytes, np.ndarray]:
+    quantized = rgb.quantize(colors=255)
+
+    return bytes(quantized.getpalette()[:765]).ljust(765, b'\x00'), np.array(quantized)
+
+
+def _to_p(colors: bytes, indices: np.ndarray, mask: np.ndarray) -> Image.Image:
+    indices[mask] = TRANSPARENT
+
+    giffed_frame = Image.fromarray(indices, 'P')
+    giffed_frame.putpalette(colors + colors[:3])
+
+    return giffed_frame
+
+
+# (RGB frame, transparency mask, palette indices, RMS error) of an RGBA frame quantized to a SharedPalette
+Quantized = Tuple[Image.Image, np.ndarray, np.ndarray, float]
+
+
+@dataclasses.dataclass
+class SharedPalette:
+    """A palette for a run of frames, and how badly it may fit a frame before that frame gets a palette of its own."""
+
+    colors: bytes
+    worst_allowed: float  # RMS error (see _rms_error())
+
+    @classmethod
+    def build(cls, frames: Sequence[Image.Image]) -> Tuple['SharedPalette', List[Quantized]]:
+        """Build a palette from a sample of frames, quantizing them all to it to see how well it fits."""
+
+        palette = cls(build_palette(frames), math.inf)
+
+        quantized = [palette.quantize(frame) for frame in frames]
+        errors = [error for _, _, _, error in quantized]
+        palette.worst_allowed = GIF_RULES['local_palette_error'] * max(float(np.median(errors)), 1.0)
+
+        return palette, quantized
+
+    def quantize(self, frame: Image.Image) -> Quantized:
+        rgb = frame.convert('RGB')
+        mask = alpha_mask(frame)
+
+        indices = np.array(rgb.quantize(palette=_palette_image(self.colors), dither=Image.NONE))  # type: np.ndarray
+        indices[indices == 255] = 0  # see _palette_image()
+
+        return rgb, mask, indices, _rms_error(np.asarray(rgb), indices, self.colors, ~mask)
+
+
+class Quantizer:
+    """Turns RGBA frames into 'P' frames with index 255 as transparency, holding `window` frames at a time."""
+
+    def __init__(self, window: int, palette: Optional[SharedPalette] = None) -> None:
+        self.window = window
+        self.palette = palette  # the palette in use; built from the first frames if not given
+
+        # frames left before the palette may be replaced, so a run of frames that nothing fits can't rebuild it for
+        # every single frame; a palette that was handed in may be replaced right away
+        self._keep_for = 0
+
+    def _rebuild(self, ahead: Iterable[List[Any]]) -> SharedPalette:
+        """Build a new palette from the frames ahead, and quantize them to it while at it."""
+
+        ahead = list(ahead)
+        self.palette, quantized = SharedPalette.build([frame for frame, _, _ in ahead])
+        for entry, frame_quantized in zip(ahead, quantized):
+            entry[2] = frame_quantized
+
+        self._keep_for = self.window
+
+        return self.palette
+
+    def stream(self, frames: Iterable[Tuple[Image.Image, Tag]]) -> Iterator[Tuple[Image.Image, Tag]]:
+        """Quantize (RGBA frame, tag) pairs to ('P' frame, tag) pairs."""
+
+        frames = iter(frames)
+
+        # [frame, tag, the frame quantized to the current palette if that's been done] for each frame read but not
+        # yet passed on
+        ahead = collections.deque([frame, tag, None] for frame, tag in itertools.islice(frames, self.window))
+
+        if self.palette is None and len(ahead) == 1:
+            following = next(frames, None)
+            if following is None:  # a single frame needs no palette shared with anything
+                frame, tag, _ = ahead[0]
+                colors, indices = _quantize_adaptive(frame.convert('RGB'))
+                yield _to_p(colors, indices, alpha_mask(frame)), tag
+                return
+
+            ahead.append([*following, None])
+
+        while ahead:
+            palette = self.palette
+            if palette is None:
+                palette = self._rebuild(ahead)
+
+            frame, tag, quantized = ahead[0]
+            if quantized is None:
+                quantized = palette.quantize(frame)
+
+            # the frames have drifted away from the palette (a scene cut, say), so build a new one from here
+            if quantized[3] > palette.worst_allowed and not self._keep_for:
+                palette = self._rebuild(ahead)
+                quantized = ahead[0][2]
+
+            ahead.popleft()
+            following = next(frames, None)
+            if following is not None:
+                ahead.append([*following, None])
+            self._keep_for = max(0, self._keep_for - 1)
+
+            rgb, mask, indices, error = quantized
+            if error > palette.worst_allowed:  # too soon to replace the palette, so a local color table it is
+                yield _to_p(*_quantize_adaptive(rgb), mask), tag
+            else:
+                yield _to_p(palette.colors, indices, mask), tag
+
+
+def _image_data(frame: Image.Image) -> bytes:
+    """LZW-compressed pixel data for a 'P' frame: the minimum code size byte, the data sub-blocks and terminator."""
+
+    # Pillow does the compressing, and the data is cut back out of a single-frame GIF; no optimizing, which would
+    # renumber the palette, and no interlacing, which the frame descriptor would need to flag
+    fp = BytesIO()
+    frame.save(fp, 'GIF', optimize=False, interlace=False)
+    data = fp.getvalue()
+
+    pos = 13
+    if data[10] & 0x80:  # global color table
+        pos += 3 * 2 ** ((data[10] & 0x07) + 1)
+
+    while data[pos] == 0x21:  # skip extensions
+        pos += 2
+        while data[pos]:
+            pos += data[pos] + 1
+        pos += 1
+
+    packed = data[pos + 9]  # image descriptor
+    pos += 10
+    if packed & 0x80:  # local color table
+        pos += 3 * 2 ** ((packed & 0x07) + 1)
+
+    start = pos
+    pos += 1  # LZW minimum code size
+    while data[pos]:
+        pos += data[pos] + 1
+
+    return data[start:pos + 1]
+
+
+def _bbox(changed: np.ndarray) -> Optional[Tuple[int, int, int, int]]:
+    """(left, top, right, bottom) of the True region of a mask, or None if there isn't one."""
+
+    rows = np.flatnonzero(changed.any(axis=1))
+    if not len(rows):
+        return None
+    columns = np.flatnonzero(changed.any(axis=0))
+
+    return int(columns[0]), int(rows[0]), int(columns[-1]) + 1, int(rows[-1]) + 1
+
+
+class _HeldFrame:
+    """A frame GifWriter has seen but not yet written."""
+
+    def __init__(self, frame: Image.Image, duration: int) -> None:
+        self.indices = np.asarray(frame)
+        self.palette = bytes(frame.getpalette()[:768])
+        self.duration = duration
+
+        self.opaque = self.indices != TRANSPARENT
+        self.draw = self.opaque  # pixels that aren't already on screen as they should be; set by GifWriter
+
+        self._rgb = None  # type: Optional[np.ndarray]
+
+    @property
+    def rgb(self) -> np.ndarray:
+        if self._rgb is None:
+            palette = np.frombuffer(self.palette, dtype=np.uint8).reshape(-1, 3)
+            self._rgb = palette[self.indices]
+
+        return self._rgb
+
+    def same_pixels(self, other: '_HeldFrame') -> np.ndarray:
+        """Where this frame shows the same color as another (transparency aside)."""
+
+        if self.palette == other.palette:  # no need to look the colors up
+            same = self.indices == other.indices  # type: np.ndarray
+        else:
+            same = (self.rgb == other.rgb).all(axis=2)
+
+        return same
+
+
+class GifWriter:
+    """Writes Quantizer output as an animated GIF, one frame at a time, storing only what changes between frames."""
+
+    def __init__(self, fp: BinaryIO, loops: Optional[bool] = None, palette: Optional[bytes] = None) -> None:
+        self.fp = fp
+        self.loops = loops
+        self.palette = palette  # the global color table; the first frame's palette if None
+
+        self._held = None  # type: Optional[_HeldFrame]
+        self._first_transparent = None  # type: Optional[np.ndarray]
+
+    def _write_header(self, held: _HeldFrame) -> None:
+        height, width = held.indices.shape
+        if self.palette is None:
+            self.palette = held.palette
+
+        # header, logical screen descriptor (global color table of 256 colors) and the global color table itself
+        self.fp.write(b'GIF89a' + struct.pack('<HHBBB', width, height, 0xF7, 0, 0) + self.palette)
+
+        if self.loops:
+            self.fp.write(b'!\xff\x0bNETSCAPE2.0\x03\x01' + struct.pack('<H', 0) + b'\x00')
+
+    def _clear_before(self, opaque: np.ndarray, transparent: np.ndarray) -> np.ndarray:
+        """Pixels of a frame, opaque where given, that must be cleared before a frame transparent where given."""
+
+        if not GIF_RULES['frame_delta']:
+            return opaque  # clear everything and redraw every frame whole
+
+        cleared = opaque & transparent  # type: np.ndarray
+        return cleared
+
+    def _write_held(self, cleared: np.ndarray) -> Optional[Tuple[int, int, int, int]]:
+        """Write the held frame. Returns the rectangle cleared after it's displayed, if any."""
+
+        held = self._held
+        assert held is not None
+
+        bbox = _bbox(held.draw | cleared)
+        if bbox is None:  # nothing to draw or clear; one pixel is as good as the whole frame
+            bbox = (0, 0, 1, 1)
+        left, top, right, bottom = bbox
+
+        disposal = 2 if cleared.any() else 1  # 1: leave the frame in place; 2: clear it to the background
+        indices = np.where(held.draw, held.indices, TRANSPARENT)[top:bottom, left:right].astype(np.uint8)
+
+        frame = Image.fromarray(indices, 'P')
+        frame.putpalette(held.palette)
+
+        # graphic control extension: disposal, delay (in hundredths of a second) and transparency index
+        self.fp.write(
+            b'!\xf9\x04' + struct.pack('<BHB', disposal << 2 | 1, int(held.duration / 10), TRANSPARENT) + b'\x00'
+        )
+
+        if held.palette == self.palette:
+            self.fp.write(b',' + struct.pack('<HHHHB', left, top, right - left, bottom - top, 0))
+        else:
+            self.fp.write(b',' + struct.pack('<HHHHB', left, top, right - left, bottom - top, 0x87) + held.palette)
+
+        self.fp.write(_image_data(frame))
+
+        return bbox if disposal == 2 else None
+
+    def add(self, frame: Image.Image, duration: int) -> None:
+        new = _HeldFrame(frame, duration)
+
+        held = self._held
+        if held is None:
+            self._write_header(new)
+            self._first_transparent = ~new.opaque
+            self._held = new  # the screen starts out transparent, so every opaque pixel gets drawn
+            return
+
+        # GIF frames can only be drawn over, not erased, so a frame is held back until the next one shows what has to
+        # be cleared after it
+        cleared = self._clear_before(held.opaque, ~new.opaque)
+
+        # once the held frame is displayed, what's on screen is exactly that frame
+        on_screen = held.opaque & new.same_pixels(held)
+        new.draw = new.opaque & ~on_screen
+
+        if not new.draw.any() and (new.opaque == held.opaque).all():  # identical, so show the held frame for longer
+            held.duration += duration
+            return
+
+        cleared_bbox = self._write_held(cleared)
+        if cleared_bbox is not None:
+            left, top, right, bottom = cleared_bbox
+            on_screen[top:bottom, left:right] = False
+            new.draw = new.opaque & ~on_screen
+
+        self._held = new
+
+    def take_output(self) -> bytes:
+        """What has been written so far to a BytesIO, which is swapped for a new one."""
+
+        # everything else the writer holds is plain data, so between frames it can carry on in another worker
+        assert isinstance(self.fp, BytesIO)
+        output = self.fp.getvalue()
+        self.fp = BytesIO()
+
+        if self._held is not None:
+            self._held._rgb = None  # no need to pickle it; it's quick to look up again
+
+        return output
+
+    def close(self) -> None:
+        """Write the last frame and the trailer."""
+
+        held = self._held
+        if held is not None:
+            # a loop goes back to the first frame, so the last one is cleared wherever the first is transparent
+            assert self._first_transparent is not None
+            self._write_held(self._clear_before(held.opaque, self._first_transparent))
+            self._held = None
+
+        self.fp.write(b';')
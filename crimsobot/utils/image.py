@@ -1,71 +1,85 @@
-import os
+import asyncio
+import collections
+import dataclasses
+import functools
+import itertools
+import json
+import math
+import time
 from io import BytesIO
-from typing import Any, Callable, List, Mapping, Optional, Tuple
+from typing import Any, Callable, Deque, Dict, Iterator, List, Mapping, Optional, Tuple, Union
 
 import aiofiles
 import aiohttp
-import matplotlib.image as plt
 import numpy as np
-from PIL import Image, ImageDraw, ImageFont, ImageOps, ImageSequence
+from PIL import Image, ImageDraw, ImageOps, ImageSequence
 from bs4 import BeautifulSoup
 from discord.ext.commands import BadArgument, Context
-from scipy.signal import convolve2d
 
-from crimsobot.data.img import (CAPTION_RULES, EIMG_WIDTH, GIF_RULES, IMAGE_RULES,
-                                color_dict, lookup_emoji, rgb_color_list)
-from crimsobot.exceptions import NoEmojiFound, NoImageFound
-from crimsobot.utils import games as crimsogames, tools as c
+from crimsobot.data.img import (CAPTION_RULES, EIMG_OVERSAMPLE, EIMG_WIDTH, ESTIMATE_RULES, FETCH_CACHE_RULES,
+                                FIT_RULES, GIF_RULES, IMAGE_RULES, PALETTE_RULES, RENDER_CACHE_RULES, SCHEDULER_RULES,
+                                WORKER_RULES, color_dict, emoji_list, lookup_emoji_indices)
+from crimsobot.exceptions import ImageTooLarge, NoEmojiFound, NoImageFound
+from crimsobot.utils import fonts, games as crimsogames, gif, net, tools as c
+from crimsobot.utils.assets import assets, emoji_index, warm_assets
+from crimsobot.utils.cache import ContentCache, TieredCache, async_content_hash, content_hash
 from crimsobot.utils.color import hex_to_rgb
-
-
-def gif_frame_transparency(img: Image.Image) -> Image.Image:
-    # get alpha mask
-    alpha = img.convert('RGBA').split()[-1]
-    # convert back to P mode but only using 255 of available 256 colors
-    img = img.convert('RGB').convert('P', palette=Image.ADAPTIVE, colors=255)
-    # set all pixel values in alpha below threshhold to 255 and the rest to 0
-    mask = Image.eval(alpha, lambda a: 255 if a <= 88 else 0)
-    # paste the color of index 255 and use alpha as a mask
-    img.paste(255, mask)  # the transparency index will later be set to 255
-
-    return img
-
-
-def image_to_buffer(image_list: List[Image.Image], durations: Optional[Tuple[int, ...]] = None,
-                    loops: Optional[bool] = None) -> BytesIO:
+from crimsobot.utils.progress import ProgressCallback, ProgressThrottle, ThroughputEstimator
+from crimsobot.utils.scheduler import JobScheduler
+from crimsobot.utils.workers import WorkerPool
+
+# downloaded (and emoji) images, so the same avatar/attachment isn't fetched over and over
+fetch_cache = ContentCache(
+    max_bytes=FETCH_CACHE_RULES['max_bytes'],
+    ttl=FETCH_CACHE_RULES['ttl'],
+    max_aliases=FETCH_CACHE_RULES['max_urls'],
+    directory=c.clib_path_join('cache', 'fetch') if FETCH_CACHE_RULES['disk'] else None,
+    disk_max_bytes=FETCH_CACHE_RULES['disk_max_bytes'],
+)
+
+# finished effect outputs, keyed by render_key()
+render_cache = TieredCache(
+    max_bytes=RENDER_CACHE_RULES['max_bytes'],
+    directory=c.clib_path_join('cache', 'render') if RENDER_CACHE_RULES['disk'] else None,
+    disk_max_bytes=RENDER_CACHE_RULES['disk_max_bytes'],
+)
+
+# CPU-heavy effects run here instead of on the default executor, so a long GIF can't starve the rest of the bot
+image_pool = WorkerPool(
+    WORKER_RULES['mode'],
+    WORKER_RULES['max_workers'],
+    WORKER_RULES['max_queue'],
+    initializer=warm_assets,
+)
+
+# decides which waiting job gets to the pool next, so a guild with a pile of GIFs queued can't hold everyone up
+image_scheduler = JobScheduler(
+    SCHEDULER_RULES['lanes'],
+    WORKER_RULES['max_queue'],
+    SCHEDULER_RULES['quantum'],
+)
+
+# how fast each effect has been rendering, for turning away jobs that would take too long
+render_estimator = ThroughputEstimator(
+    ESTIMATE_RULES['default_overhead'],
+    ESTIMATE_RULES['default_rate'],
+    ESTIMATE_RULES['min_rate'],
+    ESTIMATE_RULES['max_rate'],
+    ESTIMATE_RULES['max_overhead'],
+    ESTIMATE_RULES['smoothing'],
+)
+
+# called with (width, height, frames) as soon as they're known, to turn an image away before it's all downloaded
+SizeCheck = Callable[[int, int, int], None]
+
+
+def image_to_buffer(image_list: List[Image.Image]) -> BytesIO:
     fp = BytesIO()
-
-    if not durations:
-        image_list[0].save(fp, 'PNG')
-    else:
-        giffed_frames = []
-        for frame in image_list:
-            new_frame = gif_frame_transparency(frame)
-            giffed_frames.append(new_frame)
-        if loops:
-            giffed_frames[0].save(fp, format='GIF', transparency=255, append_images=giffed_frames[1:],
-                                  save_all=True, duration=durations, loop=0, disposal=2)
-        else:
-            giffed_frames[0].save(fp, format='GIF', transparency=255, append_images=giffed_frames[1:],
-                                  save_all=True, duration=durations, disposal=2)
-
+    image_list[0].save(fp, 'PNG')
     fp.seek(0)
     return fp
 
 
-def remove_unicode_prefix(word: str) -> str:
-    word_with_prefix = word.encode('unicode-escape').decode('utf-8', 'strict')
-
-    if r'\U' in word_with_prefix:
-        return word_with_prefix.split('\\U')[1]
-    if r'\u' in word_with_prefix:
-        return word_with_prefix.split('\\u')[1]
-    if r'\x' in word_with_prefix:
-        return word_with_prefix.split('\\x')[1]
-
-    return word
-
-
 def find_emoji_img(emoji: str) -> Tuple[Optional[str], Optional[str]]:
     # custom emojis <[a]:emoji_name:emoji_id>
     if emoji.startswith('<:') or emoji.startswith('<a:'):
@@ -79,42 +93,139 @@ def find_emoji_img(emoji: str) -> Tuple[Optional[str], Optional[str]]:
 
     # standard emojis
     else:
-        characters = []
-        for i in range(len(emoji)):
-            string = emoji[i].encode('unicode-escape')  # example result: \U001f990
-            characters.append(remove_unicode_prefix(string.decode('utf-8')).lstrip('0'))  # result: 1f990
-
-        filename = '-'.join(characters)
-
-        # exceptions
-        if filename.endswith('20e3'):
-            if filename.startswith('*'):  # asterisk
-                filename = '2a-20e3'
-            elif filename.startswith('#'):  # hash/pound sign
-                filename = '23-20e3'
-            else:  # numbers zero-nine
-                filename = '3' + filename
-
-        path = c.clib_path_join('emoji', filename + '.png')
-        emoji_type = 'file'
-
-        # Some "old" emojis (pre Emoji v1.0) have the variation indicator '-fe0f' in their Unicode sequence.
-        # Well, Discord seems to think so. Twemoji thinks otherwise. So this handles that disagreement.
-        if not os.path.exists(path):
-            if filename.endswith('-fe0f'):
-                filename = filename.replace('-fe0f', '')
-            else:
-                raise NoEmojiFound
-            path = c.clib_path_join('emoji', filename + '.png')
+        file_path = emoji_index.find(emoji)
+        if file_path is None:
+            raise NoEmojiFound
+        path, emoji_type = file_path, 'file'
 
     return path, emoji_type
 
 
-async def fetch_image(ctx: Context, arg: Optional[str]) -> Image.Image:
-    """Determine type of input, return image file."""
+class GifFrameCounter:
+    """Counts the frames of a GIF as it downloads, by walking its block structure without decoding anything."""
+
+    def __init__(self) -> None:
+        self.frames = 0
+        self._pos = 0
+        self._done = False
+
+    def feed(self, data: Union[bytes, bytearray]) -> int:
+        # data is the whole buffer received so far, but parsing resumes from the start of the last incomplete block
+        try:
+            self._parse(data)
+        except IndexError:
+            pass  # ran off the end of what has arrived so far; pick back up from _pos next time
+
+        return self.frames
+
+    def _parse(self, data: Union[bytes, bytearray]) -> None:
+        if self._done:
+            return
+
+        if self._pos == 0:
+            # 6-byte signature + 7-byte logical screen descriptor, then the global color table (if there is one)
+            packed = data[10]
+            pos = 13
+            if packed & 0x80:
+                pos += 3 * 2 ** ((packed & 0x07) + 1)
+            self._pos = pos
+
+        while self._pos < len(data):
+            pos = self._pos
+            block = data[pos]
+
+            if block == 0x21:  # extension: introducer, label, then data sub-blocks
+                pos = self._skip_sub_blocks(data, pos + 2)
+            elif block == 0x2C:  # image descriptor, i.e. one frame
+                packed = data[pos + 9]
+                pos += 10
+                if packed & 0x80:  # local color table
+                    pos += 3 * 2 ** ((packed & 0x07) + 1)
+                pos = self._skip_sub_blocks(data, pos + 1)  # + 1 skips the LZW minimum code size byte
+                self.frames += 1
+            else:  # trailer (0x3B) or garbage; either way, nothing left to count
+                self._done = True
+                return
+
+            self._pos = pos
+
+    @staticmethod
+    def _skip_sub_blocks(data: Union[bytes, bytearray], pos: int) -> int:
+        while True:
+            size = data[pos]
+            pos += size + 1
+            if size == 0:
+                return pos
+
+
+async def download_image(session: aiohttp.ClientSession, url: str, check: Optional[SizeCheck] = None) -> bytes:
+    """Stream an image into memory, bailing out as soon as it's clear that it's too big to bother with."""
+
+    # check is called with the dimensions and the frames counted so far whenever they change, and may raise
+    max_bytes = IMAGE_RULES['max_download']
+    max_pixels = IMAGE_RULES['max_pixels']
+    max_frames = GIF_RULES['max_frames']
+
+    async with session.get(url, allow_redirects=False) as response:
+        response.raise_for_status()
+
+        # aiohttp falls back to application/octet-stream if the header is missing, which is allowed through
+        content_type = response.content_type
+        if not content_type.startswith('image/') and not content_type.endswith('octet-stream'):
+            raise ValueError(f'{url} is {content_type}, not an image')
+
+        if response.content_length is not None and response.content_length > max_bytes:
+            raise ImageTooLarge(f'file is over {max_bytes // 2**20} MB')
+
+        buffer = bytearray()
+        size_checked = False
+        frame_counter = None  # type: Optional[GifFrameCounter]
+        size = None  # type: Optional[Tuple[int, int]]
+        frames_checked = 0
+
+        async for chunk in response.content.iter_chunked(2**16):
+            buffer.extend(chunk)
+
+            if len(buffer) > max_bytes:
+                raise ImageTooLarge(f'file is over {max_bytes // 2**20} MB')
+
+            if not size_checked:
+                try:
+                    width, height = Image.open(BytesIO(buffer)).size
+                    size_checked = True
+                except Exception:  # header isn't all here yet (or never will be, in which case stop trying)
+                    size_checked = len(buffer) > IMAGE_RULES['header_peek']
+                else:
+                    if width * height > max_pixels:
+                        raise ImageTooLarge(f'{width} \u2A09 {height} pixels is too many')
+
+                    size = width, height
+
+                    if buffer[:3] == b'GIF':
+                        frame_counter = GifFrameCounter()
+
+            if frame_counter is not None and frame_counter.feed(buffer) > max_frames:
+                raise ImageTooLarge(f'GIFs are limited to {max_frames} frames')
+
+            if check is not None and size is not None:
+                n_frames = max(frame_counter.frames, 1) if frame_counter is not None else 1
+                if n_frames > frames_checked:
+                    check(*size, n_frames)
+                    frames_checked = n_frames
 
-    async def open_img_from_url(url: str) -> Image.Image:
-        session = aiohttp.ClientSession()
+    return bytes(buffer)
+
+
+async def fetch_image_bytes(ctx: Context, arg: Optional[str], check: Optional[SizeCheck] = None) -> bytes:
+    """Determine type of input, return the raw (still encoded) image. check is passed on to download_image()."""
+
+    session: aiohttp.ClientSession = ctx.bot.http_session
+
+    async def read_img_from_url(url: str) -> bytes:
+        cache_key = net.normalize_url(url)
+        cached_bytes = await fetch_cache.get(cache_key)
+        if cached_bytes is not None:
+            return cached_bytes
 
         if 'tenor.com/view' in url:
             async with session.get(url, allow_redirects=False) as response:
@@ -122,29 +233,40 @@ async def fetch_image(ctx: Context, arg: Optional[str]) -> Image.Image:
                 original = soup.find(property='og:image')  # the original GIF has this property in its meta tag
                 url = original['content']
 
-        try:
-            async with session.get(url, allow_redirects=False) as response:
-                img_bytes = await response.read()
-        except Exception as e:
-            await session.close()
-            raise e
+        img_bytes = await download_image(session, url, check)
+
+        # only reads the header, but will raise if this isn't an image (so error pages never make it into the cache)
+        Image.open(BytesIO(img_bytes))
+        await fetch_cache.put(cache_key, img_bytes)
+
+        return img_bytes
 
-        await session.close()
+    async def read_img_from_file(path: str) -> bytes:
+        cached_bytes = await fetch_cache.get(path)
+        if cached_bytes is not None:
+            return cached_bytes
 
-        return Image.open(BytesIO(img_bytes))
+        async with aiofiles.open(path, 'rb') as f:
+            img_bytes = await f.read()
 
-    img = None
+        await fetch_cache.put(path, img_bytes, persist=False)  # already on disk, no need for a second copy
+
+        return img_bytes
+
+    img_bytes = None
 
     # 1. if attachment, that's the image to fetch
     if ctx.message.attachments:
         link = ctx.message.attachments[0].url
-        img = await open_img_from_url(link)
+        img_bytes = await read_img_from_url(link)
 
     # 2. if some arg (str) has been passed, that is likely the image to fetch...
     elif arg:
         try:
             # 2a. the arg might be a URL
-            img = await open_img_from_url(arg)
+            img_bytes = await read_img_from_url(arg)
+        except ImageTooLarge:
+            raise  # it was an image, just not one we're willing to deal with
         except Exception:
             # 2b. if not an image URL, it's probably an emoji
             try:
@@ -152,11 +274,9 @@ async def fetch_image(ctx: Context, arg: Optional[str]) -> Image.Image:
                 if emoji_path is None:
                     pass
                 elif emoji_type == 'file':
-                    async with aiofiles.open(emoji_path, 'rb') as f:
-                        img_bytes = await f.read()
-                    img = Image.open(BytesIO(img_bytes))
+                    img_bytes = await read_img_from_file(emoji_path)
                 elif emoji_type == 'url':
-                    img = await open_img_from_url(emoji_path)
+                    img_bytes = await read_img_from_url(emoji_path)
             # 2c. if that arg (str) was not a URL or an emoji, it might have been a mention..
             # ...which we check for last so as to not grab a mention from a reply
             except NoEmojiFound:
@@ -166,12 +286,20 @@ async def fetch_image(ctx: Context, arg: Optional[str]) -> Image.Image:
                 except AttributeError:
                     # get mentioned user's avatar
                     link = str(ctx.message.mentions[0].avatar_url)
-                    img = await open_img_from_url(link)
+                    img_bytes = await read_img_from_url(link)
 
-    if not img:
+    if not img_bytes:
         raise NoImageFound
 
-    return img
+    return img_bytes
+
+
+async def fetch_image(ctx: Context, arg: Optional[str]) -> Image.Image:
+    """Determine type of input, return image file."""
+
+    img_bytes = await fetch_image_bytes(ctx, arg)
+
+    return Image.open(BytesIO(img_bytes))
 
 
 def make_color_img(hex_str: str) -> BytesIO:
@@ -190,10 +318,7 @@ def make_color_img(hex_str: str) -> BytesIO:
 
 async def make_boop_img(the_booper: str, the_booped: str) -> BytesIO:
     # font selection
-    filename = c.clib_path_join('img', 'Roboto-BlackItalic.ttf')
-    async with aiofiles.open(filename, 'rb') as f:
-        font_bytes = await f.read()
-    font = ImageFont.truetype(BytesIO(font_bytes), 36)
+    font = fonts.get_font('Roboto-BlackItalic.ttf', 36)
 
     # add line breaks if needed to inputs
     def add_line_breaks(text: str) -> str:
@@ -246,127 +371,121 @@ async def make_emoji_image(ctx: Context, user_input: Optional[str], platform: st
     input_image = await fetch_image(ctx, user_input)
     input_image = input_image.convert('RGB')
 
-    # Nyquist sampling apply here? just to be safe
-    n = len(color_dict) * 2
-    # quantize while still large (because i am paranoid about alising)
-    input_image = input_image.quantize(colors=n, method=1, kmeans=n)
-
-    # check that image is not too tall, then resize
+    # check that image is not too tall
     width, height = input_image.size
     ratio = height / width
     if ratio > 3:
         # return a list of string(s) to remain consistent
         return ['Image is too long!']
 
+    # anything much bigger than the emoji grid only makes the quantizing below slower; box-filter it down
     final_width = EIMG_WIDTH[platform]
+    oversampled_width = final_width * EIMG_OVERSAMPLE
+    if width > oversampled_width:
+        input_image = input_image.resize((oversampled_width, int(oversampled_width * ratio)), resample=Image.BOX)
+
+    # Nyquist sampling apply here? just to be safe
+    n = len(color_dict) * 2
+    # quantize while still large (because i am paranoid about alising)
+    input_image = input_image.quantize(colors=n, method=1, kmeans=n)
+
+    # resize
     input_image = input_image.resize((final_width, int(final_width * ratio)), resample=Image.BICUBIC)
 
-    # first: quantize to palette (has to be RGB mode for that)
-    palette = Image.new('P', (1, 1))
-    palette.putpalette([i for sub in rgb_color_list for i in sub])
-    input_image = input_image.convert('RGB', dither=0)
-    input_image_p = input_image.quantize(palette=palette, dither=0)
-
-    # create dict to match palette number with actual color (for later step)
-    # keys = palette integers; values = RGB tuples
-    color_list_p = input_image_p.getcolors()  # type: List[Tuple[int, int]]
-    color_list_p = sorted(color_list_p, key=lambda tup: tup[0], reverse=True)
-    color_keys = []
-    for color_p in color_list_p:
-        color_keys.append(color_p[1])
-
-    # now for the value tuples
-    input_image_rgb = input_image_p.convert('RGB')
-    color_list_rgb = input_image_rgb.getcolors()  # type: List[Tuple[int, Tuple[int, int, int]]]
-    color_list_rgb = sorted(color_list_rgb, key=lambda tup: tup[0], reverse=True)
-    color_values = []
-    for color_rgb in color_list_rgb:
-        color_values.append(color_rgb[1])
-
-    # and finally, the dict
-    image_dict = dict(zip(color_keys, color_values))
-
-    # numpy image is array of the "palette keys" as strings
-    numpy_image = np.array(input_image_p, dtype=str)
-
-    # lookup emoji once per color, then replace in image array
-    for key, value in image_dict.items():
-        # convert key to hex format (string) for lookup_emoji()
-        hex_color = '%02x%02x%02x' % value
-        emoji = lookup_emoji(hex_color)
-        # replace all instances in the numpy image
-        numpy_image[numpy_image == str(key)] = [emoji]
-
-    # numpy_image now needs to be "stringed" out, row by row
+    # then match every pixel to its emoji in one go
+    emoji_indices = lookup_emoji_indices(np.asarray(input_image.convert('RGB')))
+    emoji_rows = np.take(np.array(emoji_list, dtype=object), emoji_indices)
+
+    # emoji_rows now needs to be "stringed" out, row by row
     string_list = []
     # zero-width space to force Discord to display emojis at text height
     spacer = '' if platform == 'desktop' else '\u200B'
-    for row in numpy_image:
+    for row in emoji_rows:
         string_list.append(f'{spacer}{"".join(row)}')
 
     return string_list
 
 
 def make_mosaic(colors: List[Tuple[int, int, int]]) -> BytesIO:
-    """Make a mosaic!"""
-    # first, some stuff
+    """Make a mosaic: a strip of 50 x 100 tiles, one per color, left to right."""
+
     width = 50
     height = 100
 
-    # generate tile for each passed color
-    tiles = []
-    for color in colors:
-        tile = Image.new('RGB', (width, height), color)
-        tiles.append(tile)
+    # one row of pixels, each tile's color repeated across its width, then that row repeated down
+    row = np.repeat(np.array(colors, dtype=np.uint8).reshape(-1, 3), width, axis=0)
+    mosaic = np.broadcast_to(row, (height, *row.shape))
 
-    rows = 1
-    columns = len(colors)
+    fp = image_to_buffer([Image.fromarray(np.ascontiguousarray(mosaic), 'RGB')])
+    return fp
 
-    # creates a new empty image, RGB mode
-    mosaic = Image.new('RGB', (int(columns * width), int(rows * height)))
 
-    k = 0
-    for j in range(0, rows * height, height):
-        for i in range(0, columns * width, width):
-            mosaic.paste(tiles[k], (i, j))
-            k = k + 1
+def flatten_onto_white(img: Image.Image) -> Image.Image:
+    """Composite an image onto a white background, dropping its alpha channel."""
 
-    fp = image_to_buffer([mosaic])
-    return fp
+    rgba = np.asarray(img.convert('RGBA'), dtype=np.uint16)
+    alpha = rgba[..., 3:]
+    rgb = (rgba[..., :3] * alpha + 255 * (255 - alpha) + 127) // 255
 
+    return Image.fromarray(rgb.astype(np.uint8), 'RGB')
 
-async def get_image_palette(ctx: Context, n: int, user_input: Optional[str]) -> Tuple[str, BytesIO, BytesIO]:
-    """Get colors of image palette!"""
 
-    # get image from url
-    img = await fetch_image(ctx, user_input)
-    img = img.convert('RGBA')
+def make_palette(img_bytes: bytes, n: int) -> Tuple[str, bytes, bytes]:
+    """Find an image's n main colors. Runs in a worker; returns the hex codes, the mosaic and the resampled image."""
 
-    width, height = img.size
-    if max(width, height) > 800:
-        ratio = max(width, height) / 800
-        img = img.resize((int(width / ratio), int(height / ratio)),
-                         resample=Image.BICUBIC)
+    # converted before scaling down, so palette and greyscale images aren't resized nearest-neighbour
+    img = Image.open(BytesIO(img_bytes)).convert('RGBA')
+    img.thumbnail((PALETTE_RULES['display_side'],) * 2, resample=Image.BICUBIC)
 
     # change transparent BG to white, bc I don't know why
-    background = Image.new('RGB', img.size, (255, 255, 255))
-    background.paste(img, mask=img.split()[3])  # 3 is the alpha channel
+    display = flatten_onto_white(img)
+    # nearest-neighbour, so the thumbnail is a plain sample of the image's own pixels rather than blends of them
+    thumb = ImageOps.contain(display, (PALETTE_RULES['quantize_side'],) * 2, method=Image.NEAREST)
+
+    quantized = thumb.quantize(colors=n, method=1, kmeans=n)
 
-    img = background.quantize(colors=n, method=1, kmeans=n)
-    resample = image_to_buffer([img])
+    # most common first, counted on the thumbnail's palette indices
+    indices, counts = np.unique(np.asarray(quantized), return_counts=True)
+    palette = np.array(quantized.getpalette()[:3 * 256], dtype=np.uint8).reshape(-1, 3)
+    colors = [(int(r), int(g), int(b)) for r, g, b in palette[indices[np.argsort(-counts, kind='stable')]]]
+    hex_colors = ['#%02x%02x%02x' % color for color in colors]
 
-    img_colors = img.convert('RGB').getcolors()  # type: List[Tuple[int, Tuple[int, int, int]]]
-    img_colors = sorted(img_colors, key=lambda tup: tup[0], reverse=True)
-    colors = []
-    hex_colors = []
-    for ii in range(0, len(img_colors)):
-        colors.append(img_colors[ii][1])
-        hex_colors.append('#%02x%02x%02x' % img_colors[ii][1])
+    # the display image is mapped onto exactly those colors, padded out to 256 with repeats of the first, so none of
+    # its pixels can land on a color that isn't in the list
+    color_bytes = bytes(channel for color in colors for channel in color)
+    palette_image = Image.new('P', (1, 1))
+    palette_image.putpalette(color_bytes + color_bytes[:3] * (256 - len(colors)))
+    resample = display.quantize(palette=palette_image, dither=Image.NONE)
 
-    # call the mosaic maker!
     mosaic = make_mosaic(colors)
 
-    return ' '.join(hex_colors), mosaic, resample
+    return ' '.join(hex_colors), mosaic.getvalue(), image_to_buffer([resample]).getvalue()
+
+
+async def get_image_palette(ctx: Context, n: int, user_input: Optional[str]) -> Tuple[str, BytesIO, BytesIO]:
+    """Get colors of image palette!"""
+
+    img_bytes = await fetch_image_bytes(ctx, user_input)
+    hex_colors, mosaic, resample = await image_pool.run(make_palette, img_bytes, n)
+
+    return hex_colors, BytesIO(mosaic), BytesIO(resample)
+
+
+def box_sum(raster: np.ndarray, size: int) -> np.ndarray:
+    """Sum of the size x size window around each pixel, for every channel of an (h, w, channels) array at once."""
+
+    # mirrored edges, with even windows half a pixel up and to the left, as in convolve2d(mode='same', boundary='symm')
+    before = size // 2
+    after = size - 1 - before
+    summed = np.pad(raster.astype(np.int32), ((before, after), (before, after), (0, 0)), mode='symmetric')
+
+    for axis in (0, 1):
+        cumulative = np.cumsum(summed, axis=axis)
+        cumulative = np.insert(cumulative, 0, 0, axis=axis)  # so that window [i, i + size) is c[i + size] - c[i]
+        length = cumulative.shape[axis]
+        summed = cumulative.take(range(size, length), axis=axis) - cumulative.take(range(0, length - size), axis=axis)
+
+    return summed
 
 
 # below are the blocking image functions (that suupport GIF) which require the executor_function wrapper
@@ -381,26 +500,11 @@ def make_acid_img(img: Image.Image, window: int) -> Image.Image:
     alpha = img.convert('RGBA').split()[-1]
     img = img.convert('RGB')
 
-    # open as raster
-    raster = plt.pil_to_array(img)
-
-    # create acidify kernel
-    kernel = np.ones((window + 1, window + 1))
-    kernel /= (window + 1)
-
-    # depth = number of channels
-    _, _, depth = raster.shape
-    acid_raster = []
-    for channel in range(depth):
-        acid_channel = convolve2d(raster[:, :, channel], kernel, mode='same', boundary='symm')
-        acid_raster.append(acid_channel)
-    acid_raster_np = np.stack(acid_raster, axis=2).astype('uint8')
-    acid_raster_fp = BytesIO()
-    plt.imsave(acid_raster_fp, acid_raster_np)
-    acid_raster_fp.seek(0)
-
-    # open as PIL image to apply alpha mask
-    img = Image.open(acid_raster_fp)
+    # the acid kernel is a (window + 1)-wide square of ones divided by only (window + 1), not its area, so values
+    # overshoot 255 and wrap around - that's what makes it acid
+    acid_raster = box_sum(np.asarray(img), window + 1) // (window + 1)
+
+    img = Image.fromarray(acid_raster.astype(np.uint8), 'RGB')
     img.putalpha(alpha)
 
     return img
@@ -420,8 +524,7 @@ def make_aenima_img(img: Image.Image, arg: None) -> Image.Image:
     bg.paste(img, (163, position), img)
 
     # 3. paste cover over result
-    with Image.open(c.clib_path_join('img', 'aenima_cover.png')) as cover:
-        bg.alpha_composite(cover, (0, 0))
+    bg.alpha_composite(assets.get('aenima_cover.png'), (0, 0))
 
     return bg
 
@@ -449,8 +552,7 @@ def make_aeroplane_img(img: Image.Image, arg: None) -> Image.Image:
     bg.paste(img, corner, img)
 
     # 4. paste cover over result
-    with Image.open(c.clib_path_join('img', 'aeroplane_cover.png')) as cover:
-        bg.alpha_composite(cover, (0, 0))
+    bg.alpha_composite(assets.get('aeroplane_cover.png'), (0, 0))
 
     return bg
 
@@ -472,63 +574,40 @@ def make_bends_img(img: Image.Image, arg: None) -> Image.Image:
     bg.alpha_composite(img)
 
     # 3. paste wordmark over result (aligned/affixed to bottom)
-    with Image.open(c.clib_path_join('img', 'the_bends.png')) as wordmark:
-        bg.alpha_composite(wordmark, (0, height - 600))
+    bg.alpha_composite(assets.get('the_bends.png'), (0, height - 600))
 
     return bg
 
 
-def make_captioned_img(img: Image.Image, caption_list: List[str]) -> Image.Image:
-    """Captions an image!"""
-    # 1. determine image size, resize to standardize text addition
-    width, height = img.size
+@functools.lru_cache(maxsize=32)
+def layout_caption(caption_list: Tuple[str, ...]) -> List[Tuple[str, int]]:
+    """Wrap each line of a caption to the caption width. Returns (text, width) for every line to draw."""
+
+    metrics = fonts.get_metrics('Roboto-BlackItalic.ttf', CAPTION_RULES['font_size'])
+    max_width = CAPTION_RULES['width'] - 2 * CAPTION_RULES['buffer_width']
+
+    return [wrapped for line in caption_list for wrapped in fonts.wrap_line(metrics, line, max_width)]
+
+
+def caption_size(size: Tuple[int, int]) -> Tuple[int, int]:
+    """The size an image is scaled to before being captioned."""
+
+    width, height = size
     ratio = width / CAPTION_RULES['width']
-    img = img.resize((int(width / ratio), int(height / ratio)), resample=Image.BICUBIC)
-    # get new size
-    width_new, height_new = img.size
 
-    # 2. fetch font
-    filename = c.clib_path_join('img', 'Roboto-BlackItalic.ttf')
-    with open(filename, 'rb') as f:
-        font_bytes = f.read()
-    font = ImageFont.truetype(BytesIO(font_bytes), CAPTION_RULES['font_size'])
-
-    # 3. build each line char by char until max width reached
-    caption_list_of_lists = []
-
-    for line in caption_list:
-        # initialize holers
-        caption_line = ''
-        caption_sublist = []  # type: List[Tuple[str, int]]
-        caption_width = 0
-        max_width = CAPTION_RULES['width'] - 2 * CAPTION_RULES['buffer_width']
-
-        for char in line:
-            if caption_width < max_width:
-                caption_line += char
-            else:  # look for the last space to break the line
-                caption_line_split = caption_line.split(' ')
-                if len(caption_line_split) > 1:
-                    newline = caption_line_split[-1]
-                    caption_line_to_append = ' '.join(caption_line_split[:-1])
-                    caption_width = font.getsize(caption_line_to_append)[0]
-                    caption_sublist.append((caption_line_to_append, caption_width))
-                    caption_line = newline
-                    caption_line += char
-                else:  # no spaces for breaking
-                    caption_width = font.getsize(caption_line)[0]
-                    caption_sublist.append((caption_line, caption_width))
-                    caption_line = char
-
-            caption_width = font.getsize(caption_line)[0]
-
-        # append final line (which, if followed by an image argument, will include a space)
-        caption_sublist.append((caption_line, caption_width))
-        caption_list_of_lists.append(caption_sublist)
-
-    final_caption_list = [item for sublist in caption_list_of_lists for item in sublist]  # type: List[Tuple[str, int]]
-
-    # 4. draw text image
+    return int(width / ratio), int(height / ratio)
+
+
+def make_caption_band(size: Tuple[int, int], caption_list: List[str]) -> Image.Image:
+    """Draw the white band of caption text that goes over an image of this size."""
+
+    width_new, _ = caption_size(size)
+
+    # 1. fetch font and lay out the caption
+    font = fonts.get_font('Roboto-BlackItalic.ttf', CAPTION_RULES['font_size'])
+    final_caption_list = layout_caption(tuple(caption_list))
+
+    # 2. draw text image
     line_height = font.getsize('y')[1] - 1  # max height of font determined by char with descender
     extra_height = line_height * len(final_caption_list) + 2 * CAPTION_RULES['buffer_height']
     text_image = Image.new('RGB', (width_new, extra_height), (255, 255, 255))
@@ -539,7 +618,16 @@ def make_captioned_img(img: Image.Image, caption_list: List[str]) -> Image.Image
         position = (w, idx * line_height + CAPTION_RULES['buffer_height'])
         draw_on_text_image.text(position, line_to_draw[0], font=font, fill=(0, 0, 0))
 
-    # 5. paste input image
+    return text_image
+
+
+def paste_caption_band(img: Image.Image, text_image: Image.Image) -> Image.Image:
+    """Resize an image to the caption width and put a band from make_caption_band() on top of it."""
+
+    img = img.resize(caption_size(img.size), resample=Image.BICUBIC)
+    width_new, height_new = img.size
+    _, extra_height = text_image.size
+
     final_image = Image.new('RGBA', (width_new, height_new + extra_height), (0, 0, 0, 0))
     final_image.paste(text_image, (0, 0))
     final_image.paste(img, (0, extra_height))
@@ -547,6 +635,12 @@ def make_captioned_img(img: Image.Image, caption_list: List[str]) -> Image.Image
     return final_image
 
 
+def make_captioned_img(img: Image.Image, caption_list: List[str]) -> Image.Image:
+    """Captions an image!"""
+
+    return paste_caption_band(img, make_caption_band(img.size, caption_list))
+
+
 def make_currents_img(img: Image.Image, flip: bool) -> Image.Image:
     img = img.convert('RGBA')
 
@@ -558,8 +652,7 @@ def make_currents_img(img: Image.Image, flip: bool) -> Image.Image:
     ratio = width / 145
     img = img.resize((int(width / ratio), int(height / ratio)), resample=Image.BICUBIC)
 
-    with Image.open(c.clib_path_join('img', 'currents_back.png')) as back:
-        back.load()
+    back = assets.get('currents_back.png').copy()
 
     # 2. paste into cover back
     _, height_new = img.size
@@ -572,8 +665,8 @@ def make_currents_img(img: Image.Image, flip: bool) -> Image.Image:
     back.paste(img, (254, row_y), img)
 
     # 3. paste cover over result
-    with Image.open(c.clib_path_join('img', 'currents_front.png')) as front:
-        back.paste(front, (0, 0), front)
+    front = assets.get('currents_front.png')
+    back.paste(front, (0, 0), front)
 
     return back
 
@@ -588,8 +681,7 @@ def make_damn_img(img: Image.Image, arg: None) -> Image.Image:
     img = img.resize((int(width / ratio), int(height / ratio)), resample=Image.BICUBIC)
 
     # 2. paste wordmark over result
-    with Image.open(c.clib_path_join('img', 'damn.png')) as wordmark:
-        img.alpha_composite(wordmark, (0, 0))
+    img.alpha_composite(assets.get('damn.png'), (0, 0))
 
     return img
 
@@ -602,15 +694,14 @@ def make_lateralus_img(img: Image.Image, arg: None) -> Image.Image:
     ratio = width / 333
     img = img.resize((int(width / ratio), int(height / ratio)), resample=Image.BICUBIC)
 
-    with Image.open(c.clib_path_join('img', 'lateralus_back.png')) as back:
-        back.load()
+    back = assets.get('lateralus_back.png').copy()
 
     # 2. paste into cover back (462 x 462 pixels)
     back.paste(img, (65, 129), img)
 
     # 3. paste wordmark over result
-    with Image.open(c.clib_path_join('img', 'lateralus_wordmark.png')) as wordmark:
-        back.paste(wordmark, (0, 0), wordmark)
+    wordmark = assets.get('lateralus_wordmark.png')
+    back.paste(wordmark, (0, 0), wordmark)
 
     return back
 
@@ -624,9 +715,8 @@ def make_needban_img(img: Image.Image, arg: None) -> Image.Image:
         img = img.resize((int(width / ratio), int(height / ratio)), resample=Image.BICUBIC)
 
     width, height = img.size
-    with Image.open(c.clib_path_join('img', 'ban.png')) as ban:
-        ban = ban.resize((width, height), resample=Image.BICUBIC)
-        img.paste(ban, (0, 0), ban)
+    ban = assets.get('ban.png', (width, height))
+    img.paste(ban, (0, 0), ban)
 
     return img
 
@@ -635,32 +725,33 @@ def make_needping_img(img: Image.Image, arg: None) -> Image.Image:
     img = img.convert('RGBA')
     img = img.resize((71, 105), resample=Image.BICUBIC)
 
-    with Image.open(c.clib_path_join('img', 'fishe_on_head.png')) as base:
-        base.load()
+    base = assets.get('fishe_on_head.png').copy()
 
     base.paste(img, (7, 4))
 
     return base
 
 
-def make_pingbadge_img(img: Image.Image, position: int) -> Image.Image:
-    # resize input image
-    img = img.convert('RGBA')
+@dataclasses.dataclass
+class PingBadge:
+    """Everything about a ping badge that depends only on the image size and badge position."""
 
-    width, height = img.size
-    if max(width, height) > 500:
-        ratio = max(width, height) / 500
-        img = img.resize((int(width / ratio), int(height / ratio)), resample=Image.BICUBIC)
+    size: Tuple[int, int]  # what the image is resized to
+    buffer: Image.Image  # cut out of the image's alpha around the badge
+    buffer_corner: Tuple[int, int]
+    badge: Image.Image
+    badge_corner: Tuple[int, int]
 
-    # get new image size
-    width, height = img.size
 
-    # will need the image's alpha mask later
-    alpha = img.split()[-1].convert('L')
+def make_pingbadge(size: Tuple[int, int], position: int) -> PingBadge:
+    # resize input image
+    width, height = size
+    if max(width, height) > 500:
+        ratio = max(width, height) / 500
+        width, height = int(width / ratio), int(height / ratio)
 
     # get original badge size and determine resize factor for badge and buffer
-    with Image.open(c.clib_path_join('img', 'roundping.png')) as badge:
-        width_badge, _ = badge.size  # square image
+    width_badge, _ = assets.get('roundping.png').size  # square image
 
     if width <= height:
         new_size = width // 3  # diameter/length of square
@@ -687,29 +778,42 @@ def make_pingbadge_img(img: Image.Image, position: int) -> Image.Image:
 
     badge_corner = (shift[0] * (width - new_size), shift[1] * (height - new_size))
 
-    # paste buffer
-    with Image.open(c.clib_path_join('img', 'roundping_buffer.png')) as buffer:
-        buffer_size, _ = buffer.size  # square image
+    # buffer
+    buffer_size, _ = assets.get('roundping_buffer.png').size  # square image
+
+    new_buffer_size = int(resize_factor * buffer_size)
+    buffer = assets.get('roundping_buffer.png', (new_buffer_size, new_buffer_size), rotation_angle, 'L')
+
+    delta = new_buffer_size - new_size
+
+    buffer_corner = (badge_corner[0] - shift[0] * delta, badge_corner[1] - shift[1] * delta)
+
+    # badge
+    badge = assets.get('roundping.png', (new_size, new_size))
+
+    return PingBadge((width, height), buffer, buffer_corner, badge, badge_corner)
 
-        new_buffer_size = int(resize_factor * buffer_size)
-        buffer = buffer.resize((new_buffer_size, new_buffer_size), resample=Image.BICUBIC)
-        buffer = buffer.rotate(rotation_angle)
-        buffer = buffer.convert('L')
 
-        delta = new_buffer_size - new_size
+def paste_pingbadge(img: Image.Image, pingbadge: PingBadge) -> Image.Image:
+    img = img.convert('RGBA')
+    if img.size != pingbadge.size:
+        img = img.resize(pingbadge.size, resample=Image.BICUBIC)
 
-        buffer_corner = (badge_corner[0] - shift[0] * delta, badge_corner[1] - shift[1] * delta)
-        alpha.paste(buffer, buffer_corner)
-        img.putalpha(alpha)
+    # paste buffer into the image's alpha mask
+    alpha = img.split()[-1].convert('L')
+    alpha.paste(pingbadge.buffer, pingbadge.buffer_corner)
+    img.putalpha(alpha)
 
     # paste badge
-    with Image.open(c.clib_path_join('img', 'roundping.png')) as badge:
-        badge = badge.resize((new_size, new_size), resample=Image.BICUBIC)
-        img.paste(badge, badge_corner, badge)
+    img.paste(pingbadge.badge, pingbadge.badge_corner, pingbadge.badge)
 
     return img
 
 
+def make_pingbadge_img(img: Image.Image, position: int) -> Image.Image:
+    return paste_pingbadge(img, make_pingbadge(img.size, position))
+
+
 def make_xokked_img(img: Image.Image, arg: None) -> Image.Image:
     img = img.convert('RGBA')
 
@@ -717,8 +821,7 @@ def make_xokked_img(img: Image.Image, arg: None) -> Image.Image:
     ratio = width / 120
     img = img.resize((int(width / ratio), int(height / ratio)), resample=Image.BICUBIC)
 
-    with Image.open(c.clib_path_join('img', 'xokked_base.png')) as base:
-        base.load()
+    base = assets.get('xokked_base.png').copy()
 
     _, height = img.size
     base.paste(img, (30, 118 - int(height / 2)))
@@ -733,58 +836,428 @@ def resize_img(img: Image.Image, scale: float) -> Image.Image:
     return img
 
 
-@c.executor_function
-def process_lower_level(img: Image.Image, effect: str, arg: int) -> BytesIO:
-    # this will only loop once for still images
-    frame_list, durations = [], []
+# an RGBA frame and its duration in milliseconds (None for a still image), as frames stream through rendering
+FrameStream = Iterator[Tuple[Image.Image, Optional[int]]]
+
+
+def decode_stream(img_bytes: bytes) -> FrameStream:
+    """Decode an image a frame at a time."""
+
+    img = Image.open(BytesIO(img_bytes))
+    for frame in ImageSequence.Iterator(img):
+        yield frame.convert('RGBA'), frame.info.get('duration')
+
+
+def effect_stream(frames: FrameStream, size: Tuple[int, int], effect: str, arg: Any) -> FrameStream:
+    # every frame is the size of the whole canvas
+    effect_function, effect_arg = prepare_effect(effect, size, arg)
+
+    for frame, duration in frames:
+        yield effect_function(frame, effect_arg), duration
+
+
+def scale_stream(frames: FrameStream, scale: float) -> FrameStream:
+    for frame, duration in frames:
+        yield resize_img(frame, scale), duration
+
+
+def sample_stream(frames: FrameStream, step: int, sample: List[Tuple[Image.Image, Optional[int]]],
+                  start: int = 0) -> FrameStream:
+    """Pass frames through, adding every step-th one (from start) to sample, cut down to its middle."""
+
+    for index, (frame, duration) in enumerate(frames, start):
+        if index % step == 0:
+            sample.append((sample_crop(frame), duration))
+
+        yield frame, duration
+
+
+def sample_step(n_frames: int) -> int:
+    """A step for sample_stream() that samples about fit.sample_frames frames."""
+
+    return max(1, n_frames // int(FIT_RULES['sample_frames']))
+
+
+def sample_crop(frame: Image.Image) -> Image.Image:
+    side = FIT_RULES['sample_side']
+    width, height = frame.size
+    left, top = max(0, (width - side) // 2), max(0, (height - side) // 2)
+
+    return frame.crop((left, top, min(width, left + side), min(height, top + side)))
+
+
+def encode_stream(frames: FrameStream, loops: Optional[bool] = None) -> bytes:
+    """Encode frames as they arrive: a still image as a PNG, anything with durations as a GIF."""
+
+    fp = BytesIO()
+
+    first_frame, first_duration = next(frames)
+    if first_duration is None:
+        first_frame.save(fp, 'PNG')
+        return fp.getvalue()
+
+    quantizer = gif.Quantizer(GIF_RULES['frame_window'])
+    writer = gif.GifWriter(fp, loops)
+    for giffed_frame, duration in quantizer.stream(itertools.chain([(first_frame, first_duration)], frames)):
+        writer.add(giffed_frame, duration or 0)
+    writer.close()
+
+    return fp.getvalue()
+
+
+def predict_scale(sample: List[Tuple[Image.Image, Optional[int]]], loops: Optional[bool], n_bytes: int,
+                  target: int) -> float:
+    """Estimate the scale at which frames that encode to n_bytes would encode to at most target bytes."""
+
+    # bytes don't shrink in proportion to pixels, since what's left is denser in detail, so binary search over trial
+    # encodes of the sample; its size relative to full scale stands in for the whole image's
+    def trial(scale: float) -> int:
+        return len(encode_stream(scale_stream(iter(sample), scale), loops))
+
+    full_size = trial(1)
+
+    def fits(scale: float) -> bool:
+        return n_bytes * trial(scale) / full_size <= target
+
+    # what the scale would be if bytes were proportional to pixels; the real answer is rarely any larger
+    high = min(1.0, math.sqrt(target / n_bytes))
+    if fits(high):
+        return high
+
+    low = high / 4  # a quarter of the width and height, so sixteen times the detail per pixel; assumed to fit
+    for _ in range(FIT_RULES['search_steps']):
+        middle = (low + high) / 2
+        if fits(middle):
+            low = middle
+        else:
+            high = middle
+
+    return low
+
+
+def first_fit_scale(sample: List[Tuple[Image.Image, Optional[int]]], loops: Optional[bool], size: Tuple[int, int],
+                    n_bytes: int, max_bytes: int) -> float:
+    """The scale to try first for frames of the given size that encoded to n_bytes, to get them under max_bytes."""
+
+    target = int(FIT_RULES['margin'] * max_bytes)
+    return max(min_fit_scale(size), predict_scale(sample, loops, n_bytes, target))
+
+
+def min_fit_scale(size: Tuple[int, int]) -> float:
+    return min(1.0, float(FIT_RULES['min_side']) / max(1, min(size)))
+
+
+def next_fit_scale(scale: float, size: Tuple[int, int], n_bytes: int, max_bytes: int) -> Optional[float]:
+    """The scale to try after one that encoded to n_bytes, which was still too many; None if there's no going lower."""
+
+    min_scale = min_fit_scale(size)
+    if scale <= min_scale:
+        return None
+
+    # the prediction was off; correct it as if bytes were proportional to pixels
+    return max(min_scale, scale * math.sqrt(FIT_RULES['margin'] * max_bytes / n_bytes))
+
+
+def fit_to_size(source: Callable[[float], FrameStream], sample: List[Tuple[Image.Image, Optional[int]]],
+                loops: Optional[bool], size: Tuple[int, int], n_bytes: int, max_bytes: int) -> bytes:
+    """Scale frames of the given size that encoded to n_bytes down until they encode to at most max_bytes."""
+
+    # source(scale) streams the frames afresh for every attempt, so memory use stays the same as for the first encode
+    scale = first_fit_scale(sample, loops, size, n_bytes, max_bytes)  # type: Optional[float]
+    for _ in range(FIT_RULES['max_passes']):
+        assert scale is not None
+        output = encode_stream(source(scale), loops)
+        if len(output) <= max_bytes:
+            return output
+
+        scale = next_fit_scale(scale, size, len(output), max_bytes)
+        if scale is None:
+            break
+
+    raise ImageTooLarge(f"it won't fit in {max_bytes // 2**20} MB, even scaled down")
+
+
+function_dict: Mapping[str, Callable] = {
+    'acid': make_acid_img,
+    'aenima': make_aenima_img,
+    'aeroplane': make_aeroplane_img,
+    'bends': make_bends_img,
+    'caption': make_captioned_img,
+    'currents': make_currents_img,
+    'damn': make_damn_img,
+    'lateralus': make_lateralus_img,
+    'needban': make_needban_img,
+    'needping': make_needping_img,
+    'pingbadge': make_pingbadge_img,
+    'xokked': make_xokked_img,
+}
+
+# effects with work that is the same for every frame can opt into a precompute stage: the first function is called
+# once per job with the frame size and the effect's argument, and the second is called on each frame with its result
+precompute_dict: Mapping[str, Tuple[Callable, Callable]] = {
+    'caption': (make_caption_band, paste_caption_band),
+    'pingbadge': (make_pingbadge, paste_pingbadge),
+}
+
+
+def prepare_effect(effect: str, size: Tuple[int, int], arg: Any) -> Tuple[Callable, Any]:
+    """Run an effect's precompute stage, if it has one. Returns the function to call on each frame and its argument."""
+
+    if effect in precompute_dict:
+        precompute, apply = precompute_dict[effect]
+        return apply, precompute(size, arg)
+
+    return function_dict[effect], arg
+
+
+# (size, pixel data, palette) of a frame that has been through a gif.Quantizer; cheap to pickle
+RawGifFrame = Tuple[Tuple[int, int], bytes, bytes]
+
+
+def render_image(img_bytes: bytes, effect: str, arg: Any, max_bytes: Optional[int] = None) -> bytes:
+    """Apply an effect to every frame of an encoded image. Runs in a worker, so it takes and returns bytes."""
+
+    img = Image.open(BytesIO(img_bytes))  # only reads the header
 
     # if a GIF loops, it will have the attribute loop = 0; if not, then attribute does not exist
-    try:
-        img.info['loop']
-        image_loop = True
-    except KeyError:
-        image_loop = False
-        pass
-
-    for _ in ImageSequence.Iterator(img):
-        # if not animated, will throw KeyError
+    image_loop = 'loop' in img.info
+
+    def rendered(scale: float = 1.0) -> FrameStream:
+        frames = effect_stream(decode_stream(img_bytes), img.size, effect, arg)
+        return frames if scale == 1 else scale_stream(frames, scale)
+
+    sample = []  # type: List[Tuple[Image.Image, Optional[int]]]
+    output = encode_stream(sample_stream(rendered(), sample_step(getattr(img, 'n_frames', 1)), sample), image_loop)
+
+    if max_bytes is not None and len(output) > max_bytes:
+        size = Image.open(BytesIO(output)).size  # the effect may have changed it
+        return fit_to_size(rendered, sample, image_loop, size, len(output), max_bytes)
+
+    return output
+
+
+def run_started(func: Callable, *args: Any) -> Tuple[float, Any]:
+    """Call func, returning the time.time() it started at along with its result."""
+
+    # so that time spent waiting for a worker can be told apart from time spent working
+    return time.time(), func(*args)
+
+
+def decode_frames(img: Image.Image, start: int, count: int) -> Tuple[List[bytes], List[int]]:
+    """Decode frames [start, start + count) of an animated image to raw RGBA, along with their durations."""
+
+    # GIF frames are stored as changes to the previous frame, so this has to be called with consecutive ranges
+    frames, durations = [], []
+    for index in range(start, min(start + count, img.n_frames)):
+        img.seek(index)
+        frames.append(img.convert('RGBA').tobytes())
+        durations.append(img.info.get('duration', 0))
+
+    return frames, durations
+
+
+def render_frames(frames: List[bytes], durations: List[int], size: Tuple[int, int], effect: str, arg: Any,
+                  palette: Optional[gif.SharedPalette] = None, scale: float = 1.0, start: int = 0, step: int = 0
+                  ) -> Tuple[List[RawGifFrame], gif.SharedPalette, List[Tuple[Image.Image, Optional[int]]]]:
+    """Apply an effect to a chunk of raw RGBA frames, scale them and palettize them. Runs in a worker."""
+
+    quantizer = gif.Quantizer(GIF_RULES['frame_window'], palette)
+    decoded = (
+        (Image.frombytes('RGBA', size, raw_frame), duration) for raw_frame, duration in zip(frames, durations)
+    )  # type: FrameStream
+    img_outs = effect_stream(decoded, size, effect, arg)
+    if scale != 1:
+        img_outs = scale_stream(img_outs, scale)
+
+    sample = []  # type: List[Tuple[Image.Image, Optional[int]]]
+    if step:
+        img_outs = sample_stream(img_outs, step, sample, start)
+
+    rendered = [
+        (giffed_frame.size, giffed_frame.tobytes(), bytes(giffed_frame.getpalette()))
+        for giffed_frame, _ in quantizer.stream(img_outs)
+    ]
+    assert quantizer.palette is not None
+
+    return rendered, quantizer.palette, sample
+
+
+def encode_frames(writer: gif.GifWriter, frames: List[RawGifFrame], durations: List[int],
+                  last: bool) -> Tuple[bytes, gif.GifWriter]:
+    """Add a chunk of palettized frames to a GifWriter, closing it after the last chunk. Runs in a worker."""
+
+    for (size, pixels, palette), duration in zip(frames, durations):
+        giffed_frame = Image.frombytes('P', size, pixels)
+        giffed_frame.putpalette(palette)
+        writer.add(giffed_frame, duration)
+
+    if last:
+        writer.close()
+
+    return writer.take_output(), writer
+
+
+async def render_image_parallel(img_bytes: bytes, effect: str, arg: Any, max_bytes: Optional[int] = None,
+                                progress: Optional[ProgressCallback] = None) -> Tuple[bytes, float]:
+    """render_image(), but with the frames of an animated image split into chunks that are rendered side by side."""
+
+    loop = asyncio.get_event_loop()
+
+    img = Image.open(BytesIO(img_bytes))
+    image_loop = 'loop' in img.info  # see render_image()
+    n_frames = img.n_frames
+
+    # one chunk per worker, unless that's more frames than should be in memory at once
+    chunk_size = min(-(-n_frames // image_pool.max_workers), GIF_RULES['frame_window'])
+    max_in_flight = image_pool.max_workers
+
+    started = math.inf
+    sample = []  # type: List[Tuple[Image.Image, Optional[int]]]
+
+    async def render_pass(scale: float, step: int, progress: Optional[ProgressCallback]) -> bytes:
+        writer = gif.GifWriter(BytesIO(), image_loop)
+        encoded = []  # type: List[bytes]
+        in_flight: Deque[Tuple[asyncio.Future, List[int]]] = collections.deque()
+        palette = None  # type: Optional[gif.SharedPalette]
+        frames_done = 0
+
+        async def write_oldest() -> None:
+            nonlocal palette, frames_done, writer, started
+
+            job, durations = in_flight.popleft()
+            chunk_started, (rendered, chunk_palette, chunk_sample) = await job
+            started = min(started, chunk_started)
+            sample.extend(chunk_sample)
+            if palette is None:
+                palette = chunk_palette
+
+            frames_done += len(durations)
+            last = not in_flight and frames_done >= n_frames
+
+            # the chunk's render is done, so its slot is free for this
+            output, writer = await slots.submit(encode_frames, writer, rendered, durations, last)
+            encoded.append(output)
+
+            if progress is not None:
+                await progress(frames_done, n_frames)
+
         try:
-            duration = img.info['duration']  # type: int
-            durations.append(duration)
-        except KeyError:
-            # an empty tuple for durations tells image_to_buffer that image is still
-            pass
-
-        function_dict: Mapping[str, Callable] = {
-            'acid': make_acid_img,
-            'aenima': make_aenima_img,
-            'aeroplane': make_aeroplane_img,
-            'bends': make_bends_img,
-            'caption': make_captioned_img,
-            'currents': make_currents_img,
-            'damn': make_damn_img,
-            'lateralus': make_lateralus_img,
-            'needban': make_needban_img,
-            'needping': make_needping_img,
-            'pingbadge': make_pingbadge_img,
-            'xokked': make_xokked_img,
-            'resize': resize_img,
-        }
-
-        # these are no longer coroutines
-        img_out = function_dict[effect](img.convert('RGBA'), arg)
-        frame_list.append(img_out)
-
-    fp = image_to_buffer(frame_list, tuple(durations), image_loop)
+            for start in range(0, n_frames, chunk_size):
+                # decoding stays out of the pool: each GIF frame needs the one before it, and a decoder can't be handed
+                # from one worker to the next the way a GifWriter can
+                frames, durations = await loop.run_in_executor(None, decode_frames, img, start, chunk_size)
+                job = asyncio.ensure_future(slots.submit(
+                    run_started, render_frames, frames, durations, img.size, effect, arg, palette, scale, start, step
+                ))
+                in_flight.append((job, durations))
+
+                # the first chunk goes on its own, so the rest can start out with its palette
+                if palette is None or len(in_flight) >= max_in_flight:
+                    await write_oldest()
+
+            while in_flight:
+                await write_oldest()
+        finally:
+            for unfinished, _ in in_flight:
+                unfinished.cancel()  # only does anything if another chunk failed
+
+        return b''.join(encoded)
+
+    # hold as many slots as there will ever be chunks out at once, so the job can't be turned away halfway through
+    slots = image_pool.reserve(min(-(-n_frames // chunk_size), max_in_flight))
+    try:
+        output = await render_pass(1.0, sample_step(n_frames) if max_bytes is not None else 0, progress)
+        if max_bytes is None or len(output) <= max_bytes:
+            return output, started
 
-    return fp
+        size = Image.open(BytesIO(output)).size  # the effect may have changed it
+        scale = await slots.submit(
+            first_fit_scale, sample, image_loop, size, len(output), max_bytes
+        )  # type: Optional[float]
+        for _ in range(FIT_RULES['max_passes']):
+            assert scale is not None
+            output = await render_pass(scale, 0, None)
+            if len(output) <= max_bytes:
+                return output, started
 
+            scale = next_fit_scale(scale, size, len(output), max_bytes)
+            if scale is None:
+                break
+    finally:
+        slots.release()
 
-async def process_image(ctx: Context, image: Optional[str], effect: str, arg: Optional[int] = None) -> Tuple[Any, Any]:
-    # grab user image and covert to RGBA
-    img = await fetch_image(ctx, image)
+    raise ImageTooLarge(f"it won't fit in {max_bytes // 2**20} MB, even scaled down")
+
+
+async def process_lower_level(img_bytes: bytes, effect: str, arg: Any, max_bytes: Optional[int] = None,
+                              progress: Optional[ProgressCallback] = None) -> Tuple[BytesIO, float]:
+    """Render an image in the pool, returning the output and how many seconds it took once a worker got to it."""
+
+    img = Image.open(BytesIO(img_bytes))  # only reads the header
+    n_frames = getattr(img, 'n_frames', 1)
+
+    if progress is not None:
+        progress = ProgressThrottle(progress, ESTIMATE_RULES['progress_interval'])
+
+    parallel = WORKER_RULES['frame_parallel'] and image_pool.max_workers > 1
+    if parallel and getattr(img, 'is_animated', False) and n_frames >= WORKER_RULES['min_parallel_frames']:
+        output, started = await render_image_parallel(img_bytes, effect, arg, max_bytes, progress)
+        return BytesIO(output), time.time() - started
+
+    started, output = await image_pool.run(run_started, render_image, img_bytes, effect, arg, max_bytes)
+    seconds = time.time() - started
+    if progress is not None:
+        await progress(n_frames, n_frames)  # rendered in one piece, so there's only the one update
+
+    return BytesIO(output), seconds
+
+
+# renders underway, by render_key(); each resolves to the output bytes, or None if its job was called off
+_in_flight: Dict[str, asyncio.Future] = {}
+
+
+async def render_key(img_bytes: bytes, effect: str, arg: Any, max_bytes: Optional[int] = None) -> str:
+    """Key for render_cache: the input's content, the effect and its argument, and the size limit."""
+
+    normalized_arg = json.dumps(arg, sort_keys=True)  # so a caption list and tuple are the same
+    input_hash = await async_content_hash(img_bytes)
+    parts = [str(RENDER_CACHE_RULES['version']), input_hash, effect, normalized_arg, str(max_bytes)]
+
+    return content_hash('\n'.join(parts).encode('utf-8'))
+
+
+def check_render_time(effect: str, width: int, height: int, n_frames: int) -> None:
+    """Raise ImageTooLarge if rendering this would probably take more than estimate.max_seconds. A SizeCheck."""
+
+    if render_estimator.samples(effect) < ESTIMATE_RULES['min_samples']:
+        return  # nothing is turned away on the defaults alone
+
+    seconds = render_estimator.seconds(effect, width, height, n_frames)
+    if seconds > ESTIMATE_RULES['max_seconds']:
+        raise ImageTooLarge(f'it would take about {seconds:.0f} seconds to render')
+
+
+def _output_buffer(output_bytes: bytes) -> Tuple[BytesIO, str]:
+    fp = BytesIO(output_bytes)
+    img_format = Image.open(fp).format  # stills come out as PNG whatever they went in as
+    fp.seek(0)
+
+    return fp, img_format
+
+
+async def charge_and_render(ctx: Context, img_bytes: bytes, effect: str, arg: Any, key: str) -> Optional[bytes]:
+    """Check, charge for (if it's a GIF) and render one job, keeping the user posted. None if it doesn't go ahead."""
+
+    # no sense charging anyone if there's no room to process it
+    image_scheduler.check_capacity()
+
+    img = Image.open(BytesIO(img_bytes))
 
     is_gif = getattr(img, 'is_animated', False)
+    n_frames = getattr(img, 'n_frames', 1)
+
+    # download_image() already checked this if the image was downloaded just now, but not if it came from the cache
+    check_render_time(effect, img.width, img.height, n_frames)
 
     if is_gif:
         if img.n_frames > GIF_RULES['max_frames']:
@@ -797,7 +1270,7 @@ async def process_image(ctx: Context, image: Optional[str], effect: str, arg: Op
             )
 
             await ctx.send(embed=embed)
-            return None, None
+            return None
 
         else:
             cost = img.n_frames * GIF_RULES['cost_per_frame']
@@ -820,7 +1293,7 @@ async def process_image(ctx: Context, image: Optional[str], effect: str, arg: Op
                 )
 
                 await ctx.send(embed=embed)
-                return None, None
+                return None
 
             else:
                 # debit the user
@@ -828,34 +1301,64 @@ async def process_image(ctx: Context, image: Optional[str], effect: str, arg: Op
                 new_bal = await crimsogames.check_balance(ctx.author)
 
             # this embed will keep user updated on processing status; will be edited below as it progresses
+            seconds = render_estimator.seconds(effect, img.width, img.height, n_frames)
+            status = [
+                f'Processing GIF for **{ctx.author.name}**...',
+                f'{img.width} \u2A09 {img.height} pixels · {img.n_frames} frames · about {seconds:.0f} s',
+            ]
             embed = c.crimbed(
                 title='PLS TO HOLD...',
-                descr='\n'.join([
-                    f'Processing GIF for **{ctx.author.name}**...',
-                    f'{img.width} \u2A09 {img.height} pixels · {img.n_frames} frames',
-                ]),
+                descr='\n'.join(status),
                 footer=f'GIF cost: \u20A2{cost:.2f} · Your balance: \u20A2{bal:.2f} ➡️ \u20A2{new_bal:.2f}',
                 color_name='yellow',
                 thumb_name='wizard',
             )
             msg = await ctx.send(embed=embed)
 
-    # original image begins processing
-    fp = await process_lower_level(img, effect, arg)
-    n_bytes = fp.getbuffer().nbytes
+    lane = 'slow' if is_gif or effect in SCHEDULER_RULES['slow_effects'] else 'fast'
+    guild_id = ctx.guild.id if ctx.guild else None  # DMs all share one queue
+
+    async def show_status(line: Optional[str]) -> None:
+        embed.description = '\n'.join(status + ([line] if line else []))
+        await msg.edit(embed=embed)
 
-    # if file too large to send via Discord, then resize
-    while n_bytes > IMAGE_RULES['max_filesize']:
+    async def show_position(position: int) -> None:
+        await show_status(f'Place in line: **{position}**' if position else None)
+
+    async def show_progress(done: int, total: int) -> None:
+        await show_status(f'Rendered **{done}** of {total} frames')
+
+    # original image begins processing once it's this job's turn; if the result is too large to send via Discord,
+    # it's scaled down to fit
+    ticket = None
+    try:
+        ticket = image_scheduler.enqueue(lane, guild_id, ctx.author.id, img.n_frames if is_gif else 1)
+        if is_gif and ticket.position:
+            await show_position(ticket.position)
+
+        await ticket.wait(show_position if is_gif else None)
+        if is_gif and embed.description != '\n'.join(status):
+            await show_position(0)
+
+        fp, seconds = await process_lower_level(
+            img_bytes, effect, arg, IMAGE_RULES['max_filesize'], show_progress if is_gif else None
+        )
+    except Exception:
+        # e.g. someone else got the last spot in the queue while this image was downloading, or the output won't fit
         if is_gif:
-            embed.title = 'RESIZING...'
+            await crimsogames.win(ctx.author, cost)  # refund
+            embed.title = 'OOF'
+            embed.description = f'Could not process GIF for **{ctx.author.name}**. Refunded \u20A2{cost:.2f}.'
+            embed.color = 0xE2853C
             await msg.edit(embed=embed)
+        raise
+    finally:
+        if ticket is not None:
+            ticket.release()
 
-        # recursively resize image until it meets Discord filesize limit
-        img = Image.open(fp)
-        scale = 0.95 * IMAGE_RULES['max_filesize'] / n_bytes  # 0.95x bias to help ensure it comes in under max size
-
-        fp = await process_lower_level(img, 'resize', scale)
-        n_bytes = fp.getbuffer().nbytes
+    output_bytes = fp.getvalue()
+    await render_cache.put(key, output_bytes)
+    render_estimator.record(effect, img.size, Image.open(fp).size, n_frames, seconds)
 
     if is_gif:
         embed.title = 'COMPLETE!'
@@ -863,4 +1366,43 @@ async def process_image(ctx: Context, image: Optional[str], effect: str, arg: Op
         embed.color = 0x5AC037
         await msg.edit(embed=embed)
 
-    return fp, img.format
+    return output_bytes
+
+
+async def process_image(ctx: Context, image: Optional[str], effect: str, arg: Optional[int] = None) -> Tuple[Any, Any]:
+    # grab user image
+    img_bytes = await fetch_image_bytes(ctx, image, functools.partial(check_render_time, effect))
+    key = await render_key(img_bytes, effect, arg, IMAGE_RULES['max_filesize'])
+
+    while True:
+        # the same image through the same effect always comes out the same, so a repeat costs nothing and needs no
+        # worker...
+        cached_bytes = await render_cache.get(key)
+        if cached_bytes is not None:
+            return _output_buffer(cached_bytes)
+
+        in_flight = _in_flight.get(key)
+        if in_flight is None:
+            break
+
+        # ...and neither does a job identical to one that's already underway: wait for that one to finish instead
+        output_bytes = await asyncio.shield(in_flight)
+        if output_bytes is not None:
+            return _output_buffer(output_bytes)
+
+        # that job never got rendered (its user couldn't afford it, say), so see whether this one can be
+
+    in_flight = asyncio.get_event_loop().create_future()
+    _in_flight[key] = in_flight
+
+    output_bytes = None
+    try:
+        output_bytes = await charge_and_render(ctx, img_bytes, effect, arg, key)
+    finally:
+        del _in_flight[key]
+        in_flight.set_result(output_bytes)
+
+    if output_bytes is None:
+        return None, None
+
+    return _output_buffer(output_bytes)
@@ -1,17 +1,335 @@
 import asyncio
+import collections
+import dataclasses
 import functools
+import hashlib
+import json
+import os
 import random as r
 import time
-from typing import Any, Callable, Dict, List, Optional, Type, Union
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple, Type, Union
 
 import markovify
 from discord.ext import tasks
 from discord.ext.commands import Bot, Context
+from markovify.chain import BEGIN, END, compile_next
 
 from crimsobot.utils import tools as c
+from crimsobot.utils.workers import WorkerPool
+
+# models that only ever have lines appended to them are updated in place; this often, they're rebuilt from scratch
+# anyway, in case their corpus was edited some other way
+COMPACT_INTERVAL = 24 * 60 * 60  # seconds
+
+# part of every snapshot's key; bump it after changing what goes into one, so older snapshots are ignored
+SNAPSHOT_VERSION = 1
+
+# (path, size in bytes, mtime, sha256 of those bytes) of a corpus file as it was when a model was built from it
+SourceFingerprint = Tuple[str, int, float, str]
+
+
+def fingerprint(path: str, size: int) -> SourceFingerprint:
+    """Fingerprint the first size bytes of a file, i.e. the part of it a model was built from."""
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as text_file:
+        digest.update(text_file.read(size))
+
+    return path, size, os.path.getmtime(path), digest.hexdigest()
+
+
+def fold_runs(chain: markovify.Chain, runs: List[List[str]]) -> int:
+    """Add runs (i.e. parsed sentences) to a compiled chain. Returns how many states were recompiled."""
+
+    state_size = chain.state_size
+
+    # count the new transitions first, so a state that comes up many times (like the beginning) is recompiled once
+    added = {}  # type: Dict[Tuple[str, ...], Dict[str, int]]
+    for run in runs:
+        items = [BEGIN] * state_size + run + [END]
+        for i in range(len(run) + 1):
+            follows = added.setdefault(tuple(items[i:i + state_size]), {})
+            follow = items[i + state_size]
+            follows[follow] = follows.get(follow, 0) + 1
+
+    for state, follows in added.items():
+        counts = {}  # type: Dict[str, int]
+        if state in chain.model:
+            # a compiled state is its choices and their cumulative counts, so take the counts back out of that
+            choices, cumulative = chain.model[state]
+            previous = 0
+            for choice, total in zip(choices, cumulative):
+                counts[choice] = total - previous
+                previous = total
+
+        for follow, count in follows.items():
+            counts[follow] = counts.get(follow, 0) + count
+
+        chain.model[state] = compile_next(counts)  # swapped in whole, so a walk never sees a half-updated state
+
+    return len(added)
+
+
+def fold_text(model: markovify.Text, text: str) -> int:
+    """Fold new corpus text into a compiled model in place. Returns how many sentences it added."""
+
+    runs = list(model.generate_corpus(text))
+    if not runs:
+        return 0
+
+    fold_runs(model.chain, runs)
+
+    if model.retain_original:
+        model.parsed_sentences.extend(runs)
+        model.rejoined_text = model.sentence_join([model.rejoined_text] + [model.word_join(run) for run in runs])
+
+    model.find_init_states_from_chain.cache_clear()  # make_sentence_with_start() has to see new states
+
+    return len(runs)
+
+
+@dataclasses.dataclass
+class BuiltModel:
+    model: markovify.Text
+    sources: List[SourceFingerprint]  # one per corpus file, in the spec's order
+    built_at: float  # time.time() of the build
+    grown: bool = False  # a single-file corpus has had lines added since (so far only ever set by ModelSpec.load())
+
+
+@dataclasses.dataclass
+class ModelSpec:
+    """Everything needed to build a model, and nothing that's not, so it can be sent to a worker process."""
+
+    path: Union[str, List[str]]
+    model_type: Type[markovify.Text]
+    args: Tuple[Any, ...]
+    kwargs: Dict[str, Any]
+    combine_weights: Optional[List[int]] = None
+    snapshot: Optional[str] = None  # file the compiled model is saved to after each build, and loaded from at startup
+
+    @property
+    def paths(self) -> List[str]:
+        return [self.path] if isinstance(self.path, str) else self.path
+
+    def snapshot_key(self) -> Dict[str, Any]:
+        """Everything besides the corpus that goes into the model, all of which a usable snapshot must match."""
+
+        return {
+            'version': SNAPSHOT_VERSION,
+            'markovify': markovify.__version__,
+            'type': self.model_type.__name__,
+            'args': list(self.args),
+            'kwargs': self.kwargs,
+            'combine_weights': self.combine_weights,
+        }
+
+    @staticmethod
+    def read_lines(path: str, start: int = 0) -> Tuple[str, int]:
+        """Read a corpus from byte offset start, returning the text and the offset to pick up from next time."""
+
+        with open(path, 'rb') as text_file:
+            text_file.seek(start)
+            data = text_file.read()
+
+        end = len(data) if start == 0 else data.rfind(b'\n') + 1
+
+        return data[:end].decode('utf-8', errors='ignore'), start + end
+
+    def build(self) -> BuiltModel:
+        built_at = time.time()
+
+        # If path is a single string, then only one model is being constructed - no combination is needed.
+        if isinstance(self.path, str):
+            text, size = self.read_lines(self.path)
+
+            model = self.model_type(text, *self.args, **self.kwargs)
+            model.compile(inplace=True)
+
+            built = BuiltModel(model, [fingerprint(self.path, size)], built_at)
+            self.save_snapshot(built)
+
+            return built
+
+        # Path is a list of strings. Multiple paths = multiple models, which we'll create, combine, and then compile.
+        models = []  # type: List[markovify.Text]
+        sources = []  # type: List[SourceFingerprint]
+        for path in self.path:
+            text, size = self.read_lines(path)
+            models.append(self.model_type(text, *self.args, **self.kwargs))
+            sources.append(fingerprint(path, size))
+
+        model = markovify.combine(models, self.combine_weights)
+        model.compile(inplace=True)
+
+        built = BuiltModel(model, sources, built_at)
+        self.save_snapshot(built)
+
+        return built
+
+    def save_snapshot(self, built: BuiltModel) -> None:
+        if self.snapshot is None:
+            return
+
+        snapshot = {
+            'key': self.snapshot_key(),
+            'built_at': built.built_at,
+            'sources': built.sources,
+            'model': built.model.to_json(),
+        }
+
+        os.makedirs(os.path.dirname(self.snapshot), exist_ok=True)
+        temp_path = f'{self.snapshot}.{os.getpid()}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f)
+        os.replace(temp_path, self.snapshot)
+
+    def load(self) -> Optional[BuiltModel]:
+        """Load the model from its snapshot, if the snapshot is still good."""
+
+        if self.snapshot is None:
+            return None
+
+        try:
+            with open(self.snapshot, encoding='utf-8') as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if snapshot.get('key') != self.snapshot_key():
+            return None
+
+        sources = [tuple(source) for source in snapshot['sources']]  # type: List[SourceFingerprint]
+        if [path for path, _, _, _ in sources] != self.paths:
+            return None
+
+        # a file is unchanged if its size and mtime match, or failing that, its content hashes the same; a single-file
+        # corpus that has only had lines added since is loaded too, marked as grown
+        grown = False
+        for path, size, mtime, digest in sources:
+            try:
+                current_size = os.path.getsize(path)
+                if current_size == size and os.path.getmtime(path) == mtime:
+                    continue
+                if current_size < size or fingerprint(path, size)[3] != digest:
+                    return None
+            except OSError:
+                return None
+
+            grown = grown or current_size > size
+
+        if grown and not isinstance(self.path, str):
+            return None  # combined models can't be updated in place
+
+        return BuiltModel(self.model_type.from_json(snapshot['model']), sources, snapshot['built_at'], grown)
+
+
+def build_model(spec: ModelSpec) -> BuiltModel:
+    """What markov_pool runs for a full build."""
+
+    return spec.build()
+
+
+# full builds run in their own process, so a big corpus being rebuilt doesn't hold the GIL the bot runs on
+markov_pool = WorkerPool('process', 1, 8)
+
+# sentences a pool refill asks for per executor call, and the attempts (walks of the chain) it may spend on them
+POOL_BATCH = 8
+POOL_BATCH_ATTEMPTS = 500
+
+# default limits for CachedMarkov.generate()
+GENERATE_ATTEMPTS = 500
+GENERATE_TIMEOUT = 2.0  # seconds, including any wait for the first model to be ready
+
+# what commands say when generation comes up empty
+NO_SENTENCE = 'NO.'
+
+# how long a refill that came back empty-handed waits before trying again, doubling each time up to the maximum
+POOL_BACKOFF = 1.0  # seconds
+POOL_MAX_BACKOFF = 60.0
+
+
+@dataclasses.dataclass
+class Generated:
+    """What came of asking for a sentence."""
+
+    text: Optional[str]  # None if the attempts or the time ran out first
+    attempts: int  # walks of the chain it took; 0 if it came from a pool
+    seconds: float
+    pooled: bool = False
+
+    @property
+    def ok(self) -> bool:
+        return self.text is not None
+
+
+def attempt_sentence(model: markovify.Text, max_chars: Optional[int]) -> Optional[str]:
+    """One walk of the chain: a sentence (of at most max_chars, if given), or None if this walk didn't make the cut."""
+
+    # tries=1 turns off markovify's own retries, so that callers count (and limit) every walk themselves
+    if max_chars:
+        return model.make_short_sentence(max_chars, tries=1)  # type: ignore[no-any-return]
+
+    return model.make_sentence(tries=1)  # type: ignore[no-any-return]
+
+
+def generate_sentence(model: markovify.Text, max_chars: Optional[int], attempts: int, deadline: float) -> Generated:
+    """Try for a sentence until one comes out, attempts run out or time.monotonic() passes deadline."""
+
+    started = time.monotonic()
+    for attempt in range(1, attempts + 1):
+        text = attempt_sentence(model, max_chars)
+        if text is not None or time.monotonic() >= deadline:
+            return Generated(text, attempt, time.monotonic() - started)
+
+    return Generated(None, attempts, time.monotonic() - started)
+
+
+def generate_batch(model: markovify.Text, max_chars: Optional[int], count: int, attempts: int) -> List[str]:
+    """Make up to count sentences (of at most max_chars, if given) in at most that many attempts."""
+
+    sentences = []  # type: List[str]
+    for _ in range(attempts):
+        sentence = attempt_sentence(model, max_chars)
+        if sentence is not None:
+            sentences.append(sentence)
+            if len(sentences) >= count:
+                break
+
+    return sentences
+
+
+class SentencePool:
+    """Sentences made ahead of time for one model and length limit, so commands can take one without waiting."""
+
+    def __init__(self, low: int, high: int) -> None:
+        self.low = low  # refilled up to high whenever it drops below this
+        self.high = high
+
+        self.sentences: Deque[str] = collections.deque()
+
+        self.hits = 0
+        self.misses = 0
+        self.generated = 0
+
+    @property
+    def wanted(self) -> int:
+        return self.high - len(self.sentences)
+
+    @property
+    def needs_refill(self) -> bool:
+        return len(self.sentences) < self.low
+
+    def take(self) -> Optional[str]:
+        if self.sentences:
+            self.hits += 1
+            return self.sentences.popleft()
+
+        self.misses += 1
+        return None
 
 
 class CachedMarkov:
+    """Serves sentences from a Markov model that can be rebuilt at any time without anyone having to wait for it."""
 
     def __init__(
         self,
@@ -19,56 +337,273 @@ class CachedMarkov:
         model_type: Type[markovify.Text],
         *args: Any,
         combine_weights: Optional[List[int]] = None,
+        snapshot: Optional[str] = None,
+        pools: Optional[Dict[Optional[int], Tuple[int, int]]] = None,
         **kwargs: Any
     ) -> None:
+        self.spec = ModelSpec(path, model_type, args, kwargs, combine_weights, snapshot)
         self.stale = True
-        self._combine_weights = combine_weights
-        self._model: Type[markovify.Text]
-        self._model_type = model_type
-        self._model_args = args
-        self._model_kwargs = kwargs
-        self._path = path
-
-    @c.executor_function
-    def build(self) -> None:
-        self.stale = False  # We're updating the model, so it's no longer stale
-        # If path is a single string, then only one model is being constructed - no combination is needed.
-        if isinstance(self._path, str):
-            with open(self._path, encoding='utf-8', errors='ignore') as text_file:
-                text = text_file.read()
 
-            self._model = self._model_type(text, *self._model_args, **self._model_kwargs)
-            self._model.compile(inplace=True)
+        # sentence pools by max_chars (None for sentences of any length), from (low, high) watermarks
+        self.pools = {max_chars: SentencePool(*marks) for max_chars, marks in (pools or {}).items()}
+        self._refill_wanted = None  # type: Optional[asyncio.Event]
+        self._refiller = None  # type: Optional[asyncio.Future]
+
+        self._model = None  # type: Optional[markovify.Text]
+        self._ready = None  # type: Optional[asyncio.Future]
+
+        self.built_at = 0.0  # time.time() of the last full build
+        self._read_to = 0  # bytes of a single-file corpus that are in the model
+
+        # metrics
+        self.builds = 0
+        self.last_build_seconds = 0.0
+        self.total_build_seconds = 0.0
+        self.swaps = 0
+        self.swapped_at = 0.0  # time.time()
+        self.updates = 0
+        self.loaded_snapshot = False
+        self.generate_calls = 0  # not counting sentences that came from a pool
+        self.generate_attempts = 0
+        self.generate_failures = 0
+
+    def _readiness(self) -> asyncio.Future:
+        # made on first use, so that it belongs to whichever loop is running by then
+        if self._ready is None:
+            self._ready = asyncio.get_event_loop().create_future()
+
+        return self._ready
+
+    @property
+    def ready(self) -> bool:
+        return self._model is not None
+
+    async def model(self) -> markovify.Text:
+        """The model currently being served, waiting for the first one if there isn't one yet."""
+
+        if self._model is None:
+            await asyncio.shield(self._readiness())  # shielded, so one waiter being cancelled doesn't cancel the rest
+
+        assert self._model is not None
+        return self._model
+
+    def _swap(self, built: BuiltModel) -> None:
+        # a single assignment, so anything already generating from the old model just carries on with it
+        self._model = built.model
+        self.built_at = built.built_at
+        self._read_to = built.sources[0][1]
+        self.swaps += 1
+        self.swapped_at = time.time()
+
+        ready = self._readiness()
+        if not ready.done():
+            ready.set_result(None)
+
+        for pool in self.pools.values():
+            pool.sentences.clear()
+        self._wake_refiller()
+
+    def _wake_refiller(self) -> None:
+        if not self.pools:
+            return
+
+        if self._refill_wanted is None:
+            self._refill_wanted = asyncio.Event()
+        self._refill_wanted.set()
+
+        if self._refiller is None or self._refiller.done():
+            self._refiller = asyncio.ensure_future(self._refill())
+
+    async def _refill(self) -> None:
+        """Keep the pools topped up, one small executor call at a time, for as long as the bot runs."""
+
+        assert self._refill_wanted is not None
+        backoff = POOL_BACKOFF
+
+        while True:
+            await self._refill_wanted.wait()
+            self._refill_wanted.clear()
+
+            starved = False
+            for max_chars, pool in self.pools.items():
+                while pool.wanted > 0:
+                    model = await self.model()
+                    batch = await async_wrap(
+                        generate_batch, model, max_chars, min(pool.wanted, POOL_BATCH), POOL_BATCH_ATTEMPTS
+                    )  # type: List[str]
+
+                    if model is not self._model:
+                        continue  # swapped while this batch was being made, so it's from the wrong model
+
+                    pool.sentences.extend(batch)
+                    pool.generated += len(batch)
+
+                    if not batch:
+                        starved = True
+                        break
+
+            if starved:
+                # some model and limit hardly ever make a sentence; don't hog an executor thread over it
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, POOL_MAX_BACKOFF)
+                self._refill_wanted.set()
+            else:
+                backoff = POOL_BACKOFF
+
+    def stop(self) -> None:
+        if self._refiller is not None:
+            self._refiller.cancel()
+
+    async def generate(self, max_chars: Optional[int] = None, attempts: int = GENERATE_ATTEMPTS,
+                       timeout: float = GENERATE_TIMEOUT) -> Generated:
+        """A sentence of at most max_chars characters, from the pool if there's one, else made on the spot."""
+
+        started = time.monotonic()
+
+        pool = self.pools.get(max_chars)
+        if pool is not None:
+            sentence = pool.take()
+            if pool.needs_refill:
+                self._wake_refiller()
+            if sentence is not None:
+                return Generated(sentence, 0, 0.0, pooled=True)
 
-            return None
+        self.generate_calls += 1
+        try:
+            model = await asyncio.wait_for(self.model(), timeout)
+        except asyncio.TimeoutError:
+            self.generate_failures += 1
+            return Generated(None, 0, time.monotonic() - started)
+
+        result = await async_wrap(
+            generate_sentence, model, max_chars, attempts, started + timeout
+        )  # type: Generated
+        result.seconds = time.monotonic() - started
 
-        # Path is a list of strings. Multiple paths = multiple models, which we'll create, combine, and then compile.
-        models = []  # type: List[markovify.Text]
-        for path in self._path:
-            with open(path, encoding='utf-8', errors='ignore') as text_file:
-                models.append(self._model_type(text_file.read(), *self._model_args, **self._model_kwargs))
+        self.generate_attempts += result.attempts
+        if not result.ok:
+            self.generate_failures += 1
+
+        return result
+
+    async def load(self) -> bool:
+        """Start serving the model's snapshot, if it's still good (see ModelSpec.load()). Returns whether it was."""
+
+        built = await async_wrap(self.spec.load)
+        if built is None:
+            return False
+
+        self._swap(built)
+        self.stale = built.grown
+        self.loaded_snapshot = True
+
+        return True
+
+    @property
+    def can_update(self) -> bool:
+        """Whether update() can bring the model up to date, rather than it needing a full build()."""
+
+        path = self.spec.path
+        if not isinstance(path, str) or not self.ready or time.time() - self.built_at > COMPACT_INTERVAL:
+            return False
+
+        try:
+            return os.path.getsize(path) >= self._read_to  # a corpus that shrank wasn't only appended to
+        except OSError:
+            return False
 
-        self._model = markovify.combine(models, self._combine_weights)
-        self._model.compile(inplace=True)
+    async def refresh(self) -> None:
+        """Bring a stale model up to date, as cheaply as possible."""
+
+        if self.can_update:
+            await self.update()
+        else:
+            await self.build()
 
-    @c.executor_function
-    def make_sentence(self, init_state: Optional[Any] = None, **kwargs: Any) -> Any:
-        return self._model.make_sentence(init_state, **kwargs)
+    async def update(self) -> int:
+        """Fold new lines of a single-file corpus into the served model. Returns how many sentences there were."""
+
+        self.stale = False
+        model = await self.model()
+
+        assert isinstance(self.spec.path, str)
+        try:
+            text, read_to = await async_wrap(self.spec.read_lines, self.spec.path, self._read_to)
+            added = await async_wrap(fold_text, model, text)  # type: int
+        except Exception:
+            self.stale = True  # the same lines are read again next time around
+            raise
 
-    @c.executor_function
-    def make_short_sentence(self,  max_chars: int, min_chars: int = 0, **kwargs: Any) -> Any:
-        return self._model.make_short_sentence(max_chars, min_chars, **kwargs)
+        self._read_to = read_to  # only once they're in the model
+        self.updates += 1
 
-    @c.executor_function
-    def make_sentence_with_start(self, beginning: str, strict: bool = True, **kwargs: Any) -> Any:
-        return self._model.make_sentence_with_start(beginning, strict, **kwargs)
+        return added
+
+    async def build(self) -> None:
+        """Build the model from scratch in a worker process, and swap it in when it's done."""
+
+        self.stale = False  # We're updating the model, so it's no longer stale
+        started = time.monotonic()
+        try:
+            built = await markov_pool.submit(build_model, self.spec)
+        except Exception:
+            self.stale = True  # try again next time around
+            raise
+
+        self.last_build_seconds = time.monotonic() - started
+        self.total_build_seconds += self.last_build_seconds
+        self.builds += 1
+
+        self._swap(built)
+
+    async def make_sentence(self, init_state: Optional[Any] = None, **kwargs: Any) -> Any:
+        model = await self.model()
+        return await async_wrap(model.make_sentence, init_state, **kwargs)
+
+    async def make_short_sentence(self, max_chars: int, min_chars: int = 0, **kwargs: Any) -> Any:
+        model = await self.model()
+        return await async_wrap(model.make_short_sentence, max_chars, min_chars, **kwargs)
+
+    async def make_sentence_with_start(self, beginning: str, strict: bool = True, **kwargs: Any) -> Any:
+        model = await self.model()
+        return await async_wrap(model.make_sentence_with_start, beginning, strict, **kwargs)
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.time()
+
+        stats = {
+            'ready': self.ready,
+            'stale': self.stale,
+            'from_snapshot': self.loaded_snapshot,
+            'builds': self.builds,
+            'last_build_s': round(self.last_build_seconds, 2),
+            'mean_build_s': round(self.total_build_seconds / self.builds, 2) if self.builds else 0,
+            'updates': self.updates,
+            'swaps': self.swaps,
+            'since_swap_s': round(now - self.swapped_at) if self.swaps else None,
+            'since_build_s': round(now - self.built_at) if self.built_at else None,
+            'generate_calls': self.generate_calls,
+            'generate_attempts': self.generate_attempts,
+            'generate_failures': self.generate_failures,
+        }
+
+        for max_chars, pool in self.pools.items():
+            name = f'pool_{max_chars or "any"}'
+            stats.update({
+                f'{name}_size': len(pool.sentences),
+                f'{name}_hits': pool.hits,
+                f'{name}_misses': pool.misses,
+                f'{name}_generated': pool.generated,
+            })
+
+        return stats
 
 
 @tasks.loop(minutes=10)
 async def update_models(bot: Bot) -> None:
     for model in bot.markov_cache.values():
         if model.stale:
-            await model.build()
+            await model.refresh()
 
 
 def learner(msg: str) -> None:
@@ -91,62 +626,44 @@ def scatter(msg_list: List[str]) -> str:
     model = markovify.NewlineText(one_long_string, state_size=1)
 
     # sometimes this process will fail to make a new sentence if the corpus is too short or lacks variety.
-    # so I let it try for 8 seconds to do the thing, but kill it after that.
-    now = time.time()
-    out = None  # type: Optional[str]
-    while time.time() < now + 5:
-        if not out:
-            out = model.make_short_sentence(r.randint(40, 400))
-            if out:
-                break
-
-    if not out:
-        out = 'NO.'
+    # so I let it try for a while to do the thing, but stop it after that.
+    result = generate_sentence(model, r.randint(40, 400), GENERATE_ATTEMPTS, time.monotonic() + GENERATE_TIMEOUT)
 
-    return out
+    return result.text or NO_SENTENCE
 
 
 async def poem(ctx: Context, number_lines: int) -> str:
     """Write a poem."""
 
-    output_poem = []  # type: List[str]
-    for _ in range(number_lines):
-        outline = None
-        while outline is None:
-            outline = await ctx.bot.markov_cache['poem'].make_short_sentence(80)
-        output_poem.append(outline)
+    lines = [await ctx.bot.markov_cache['poem'].generate(80) for _ in range(number_lines)]
+    output_poem = [line.text for line in lines if line.ok]
 
-    return '\n'.join(output_poem)
+    return '\n'.join(output_poem) or NO_SENTENCE
 
 
 async def wisdom(ctx: Context) -> str:
     """Wisdom."""
 
-    output = None
-    while output is None:
-        output = await ctx.bot.markov_cache['wisdom'].make_short_sentence(300)
+    output = await ctx.bot.markov_cache['wisdom'].generate(300)
 
-    return output
+    return output.text or NO_SENTENCE
 
 
 async def rovin(ctx: Context) -> str:
     """Wisdom."""
 
-    output = []  # type: List[str]
-    while len(output) < 5:
-        output.append(await ctx.bot.markov_cache['rovin'].make_short_sentence(300))
+    sentences = [await ctx.bot.markov_cache['rovin'].generate(300) for _ in range(5)]
+    output = [sentence.text for sentence in sentences if sentence.ok]
 
-    return ' '.join(output)
+    return ' '.join(output) or NO_SENTENCE
 
 
 async def crimso(ctx: Context) -> str:
     """Generates crimsonic text."""
 
-    output = None
-    while output is None:
-        output = await ctx.bot.markov_cache['crimso'].make_sentence()
+    output = await ctx.bot.markov_cache['crimso'].generate()
 
-    return output
+    return output.text or NO_SENTENCE
 
 
 async def async_wrap(func: Callable, *args: Any, **kwargs: Any) -> Any:
@@ -159,30 +676,45 @@ async def async_wrap(func: Callable, *args: Any, **kwargs: Any) -> Any:
 
 
 async def initialize_markov() -> Dict[str, CachedMarkov]:
+    def snapshot(name: str) -> str:
+        return c.clib_path_join('cache', 'markov', name + '.json')
+
     cache = {
         'crimso': CachedMarkov(
             c.clib_path_join('text', 'crimso.txt'),
             markovify.NewlineText,
             state_size=2,
-            retain_original=False
+            retain_original=False,
+            snapshot=snapshot('crimso'),
+            pools={None: (5, 20)},  # pings
         ),
         'rovin': CachedMarkov(
             c.clib_path_join('text', 'rovin.txt'),
             markovify.Text,
-            state_size=3
+            state_size=3,
+            snapshot=snapshot('rovin'),
+            pools={300: (5, 15)},  # five a go
         ),
         'wisdom': CachedMarkov(
             c.clib_path_join('text', 'wisdom.txt'),
             markovify.Text,
             state_size=3,
+            snapshot=snapshot('wisdom'),
+            pools={300: (2, 6)},
         ),
         'poem': CachedMarkov(
             [c.clib_path_join('text', 'all.txt'), c.clib_path_join('text', 'randoms.txt')],
             markovify.Text,
             combine_weights=[1, 2],
             state_size=2,
-            retain_original=False
+            retain_original=False,
+            snapshot=snapshot('poem'),
+            pools={80: (10, 30)},  # about five lines a poem, and each one takes a good few tries
         ),
     }
 
+    # models with a good snapshot are ready to go straight away; the rest stay stale for update_models() to build
+    for model in cache.values():
+        await model.load()
+
     return cache
@@ -0,0 +1,40 @@
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import aiohttp
+
+from config import (HTTP_CONNECT_TIMEOUT, HTTP_DNS_CACHE_TTL, HTTP_KEEPALIVE_TIMEOUT, HTTP_LIMIT_PER_HOST,
+                    HTTP_READ_TIMEOUT, HTTP_TOTAL_TIMEOUT)
+
+
+def create_session() -> aiohttp.ClientSession:
+    """Build the bot-lifetime HTTP session. Must be called from within the running event loop."""
+
+    # pooled and kept alive, so repeat fetches from the same CDN don't pay for a fresh TCP + TLS handshake every time
+    connector = aiohttp.TCPConnector(
+        limit_per_host=HTTP_LIMIT_PER_HOST,
+        use_dns_cache=True,
+        ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+        keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+    )
+
+    timeout = aiohttp.ClientTimeout(
+        total=HTTP_TOTAL_TIMEOUT,
+        sock_connect=HTTP_CONNECT_TIMEOUT,
+        sock_read=HTTP_READ_TIMEOUT,
+    )
+
+    return aiohttp.ClientSession(
+        connector=connector,
+        timeout=timeout,
+        headers={'User-Agent': 'crimsoBOT (https://crimso.bot)'},
+    )
+
+
+def normalize_url(url: str) -> str:
+    """Reduce a URL to a canonical form so trivially different spellings of the same resource compare equal."""
+
+    parts = urlsplit(url.strip().strip('<>'))  # Discord users wrap links in <> to suppress embeds
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+
+    # the fragment never reaches the server, so it's dropped entirely
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path, query, ''))
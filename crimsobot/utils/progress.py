@@ -0,0 +1,129 @@
+import time
+from typing import Awaitable, Callable, Dict, Tuple, Union
+
+ProgressCallback = Callable[[int, int], Awaitable[None]]
+
+
+class ProgressThrottle:
+    """Passes (done, total) updates on to a callback, but no more than once every interval seconds."""
+
+    def __init__(self, callback: ProgressCallback, interval: float) -> None:
+        self.callback = callback
+        self.interval = interval
+
+        self._last = time.monotonic()  # the first update waits an interval too; there's nothing to say at 0%
+
+    async def __call__(self, done: int, total: int) -> None:
+        now = time.monotonic()
+        if done < total and now - self._last < self.interval:  # the final update always goes through
+            return
+
+        self._last = now
+        await self.callback(done, total)
+
+
+class _LinearFit:
+    """Exponentially weighted least-squares fit of y = intercept + slope * x."""
+
+    def __init__(self, intercept: float, slope: float, prior_x: float, smoothing: float) -> None:
+        self.smoothing = smoothing
+        self.samples = 0
+
+        # weighted sums of 1, x, y, x^2 and x * y, starting out as a sample's worth of points on the prior line (half at
+        # x = 0, half at x = prior_x), which fades out as real samples come in
+        self._w = 1.0
+        self._x = prior_x / 2
+        self._y = intercept + slope * prior_x / 2
+        self._xx = prior_x ** 2 / 2
+        self._xy = prior_x * (intercept + slope * prior_x) / 2
+
+    def add(self, x: float, y: float) -> None:
+        keep = 1 - self.smoothing
+        self._w = keep * self._w + self.smoothing
+        self._x = keep * self._x + self.smoothing * x
+        self._y = keep * self._y + self.smoothing * y
+        self._xx = keep * self._xx + self.smoothing * x * x
+        self._xy = keep * self._xy + self.smoothing * x * y
+        self.samples += 1
+
+    @property
+    def slope(self) -> float:
+        spread = self._w * self._xx - self._x ** 2
+        if spread <= 0:  # only rounding error left of the prior, and every sample at the same x
+            return 0.0
+
+        return (self._w * self._xy - self._x * self._y) / spread
+
+    @property
+    def intercept(self) -> float:
+        return (self._y - self.slope * self._x) / self._w
+
+
+class ThroughputEstimator:
+    """Predicts how long an effect will take to render: an overhead per job, plus a cost per megapixel of output."""
+
+    def __init__(self, default_overhead: float, default_rate: float, min_rate: float, max_rate: float,
+                 max_overhead: float, smoothing: float) -> None:
+        self.default_overhead = default_overhead
+        self.default_rate = default_rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.max_overhead = max_overhead
+        self.smoothing = smoothing
+
+        # per effect, output frame size against input frame size (most effects scale images to a size of their own), and
+        # seconds against megapixels of output
+        self.sizes = {}  # type: Dict[str, _LinearFit]
+        self.timings = {}  # type: Dict[str, _LinearFit]
+
+    @staticmethod
+    def megapixels(width: int, height: int) -> float:
+        return width * height / 1e6
+
+    def _fits(self, effect: str) -> Tuple[_LinearFit, _LinearFit]:
+        if effect not in self.timings:
+            self.sizes[effect] = _LinearFit(0, 1, 1, self.smoothing)  # output the same size as the input
+            self.timings[effect] = _LinearFit(self.default_overhead, self.default_rate, 10, self.smoothing)
+
+        return self.sizes[effect], self.timings[effect]
+
+    def samples(self, effect: str) -> int:
+        return self.timings[effect].samples if effect in self.timings else 0
+
+    # clamped, so a few odd timings can't make an effect look free, or so slow it's turned away (and never timed again)
+    def overhead(self, effect: str) -> float:
+        return min(self.max_overhead, max(0.0, self._fits(effect)[1].intercept))
+
+    def rate(self, effect: str) -> float:
+        """Seconds per megapixel of output frames."""
+
+        return min(self.max_rate, max(self.min_rate, self._fits(effect)[1].slope))
+
+    def output_megapixels(self, effect: str, width: int, height: int) -> float:
+        """Predicted size of one output frame, for an input frame of this size."""
+
+        sizes = self._fits(effect)[0]
+        return max(0.0, sizes.intercept + sizes.slope * self.megapixels(width, height))
+
+    def seconds(self, effect: str, width: int, height: int, n_frames: int) -> float:
+        work = self.output_megapixels(effect, width, height) * n_frames
+        return self.overhead(effect) + self.rate(effect) * work
+
+    def record(self, effect: str, size: Tuple[int, int], output_size: Tuple[int, int], n_frames: int,
+               seconds: float) -> None:
+        """Learn from a render of n_frames frames of size into output_size, which took seconds in a worker."""
+
+        sizes, timings = self._fits(effect)
+        output_megapixels = self.megapixels(*output_size)
+
+        sizes.add(self.megapixels(*size), output_megapixels)
+        timings.add(output_megapixels * n_frames, seconds)
+
+    def stats(self) -> Dict[str, Union[int, float]]:
+        stats = {}  # type: Dict[str, Union[int, float]]
+        for effect in sorted(self.timings):
+            stats[f'{effect}_overhead_s'] = round(self.overhead(effect), 3)
+            stats[f'{effect}_s_per_mpx'] = round(self.rate(effect), 4)
+            stats[f'{effect}_timed'] = self.samples(effect)
+
+        return stats
@@ -0,0 +1,246 @@
+import asyncio
+import collections
+import time
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, Iterator, Optional, Tuple
+
+from crimsobot.exceptions import WorkersBusy
+
+
+class Ticket:
+    """One job's place in a JobScheduler, from being queued until it's released."""
+
+    def __init__(self, scheduler: 'JobScheduler', lane: str, guild: Hashable, user: Hashable, cost: float) -> None:
+        self.scheduler = scheduler
+        self.lane = lane
+        self.guild = guild
+        self.user = user
+        self.cost = cost
+
+        self.queued_at = time.monotonic()
+        self.started = False
+        self.released = False
+
+        self._moved = asyncio.Event()  # set whenever the queue ahead of this ticket may have changed
+        self._start = asyncio.Event()
+
+    @property
+    def position(self) -> int:
+        """How many jobs in this ticket's lane will start before it does; 0 once it has started."""
+
+        if self.started:
+            return 0
+
+        return self.scheduler.position(self)
+
+    async def wait(self, on_position: Optional[Callable[[int], Awaitable[Any]]] = None) -> None:
+        """Wait for this job's turn. on_position is called with the new position whenever it changes."""
+
+        position = self.position
+        while not self.started:
+            await self._moved.wait()
+            self._moved.clear()  # before reading the position, so a move during on_position() isn't missed
+
+            if on_position is not None and not self.started and self.position != position:
+                position = self.position
+                await on_position(position)
+
+        await self._start.wait()
+
+    def release(self) -> None:
+        """Give up the ticket's slot (or its place in the queue, if it never started)."""
+
+        self.scheduler.release(self)
+
+
+class _GuildQueue:
+    """A guild's waiting jobs, one queue per user, plus its deficit counter for deficit round robin."""
+
+    def __init__(self, deficit: float) -> None:
+        self.users: 'collections.OrderedDict[Hashable, Deque[Ticket]]' = collections.OrderedDict()
+        self.deficit = deficit
+
+    def __len__(self) -> int:
+        return sum(len(tickets) for tickets in self.users.values())
+
+
+class _Lane:
+    def __init__(self, slots: int) -> None:
+        self.slots = slots
+        self.running = 0
+        self.guilds = collections.OrderedDict()  # type: collections.OrderedDict[Hashable, _GuildQueue]
+
+        self.started = 0
+        self.max_waiting = 0
+        self.total_wait = 0.0
+
+    @property
+    def waiting(self) -> int:
+        return sum(len(guild) for guild in self.guilds.values())
+
+    def pop(self, quantum: float) -> Ticket:
+        """Take the next job, by deficit round robin over guilds and plain round robin over each guild's users."""
+
+        # each turn a guild gets adds quantum to its deficit, and it may start jobs as long as their cost fits, so a
+        # guild sending big jobs waits more rounds between them. The quantum is added as a turn ends, for the next one
+        while True:
+            guild_id, guild = next(iter(self.guilds.items()))
+            user_id, tickets = next(iter(guild.users.items()))
+
+            if tickets[0].cost > guild.deficit:
+                guild.deficit += quantum
+                self.guilds.move_to_end(guild_id)
+                continue
+
+            ticket = tickets.popleft()
+            guild.deficit -= ticket.cost
+
+            # the user goes to the back of the guild's line, and the guild to the back of the lane's once its turn is
+            # used up (or it has nothing left)
+            if tickets:
+                guild.users.move_to_end(user_id)
+            else:
+                del guild.users[user_id]
+
+            if not guild.users:
+                del self.guilds[guild_id]  # an idle guild doesn't bank deficit for later
+            elif guild.users[next(iter(guild.users))][0].cost > guild.deficit:
+                guild.deficit += quantum
+                self.guilds.move_to_end(guild_id)
+
+            return ticket
+
+    def order(self, quantum: float) -> Iterator[Ticket]:
+        """The waiting jobs in the order pop() would take them, without taking any."""
+
+        # the same steps as pop(), on just the turn order, the deficits and how far into each user's queue it has got
+        guilds = collections.deque(self.guilds)
+        deficits = {guild_id: guild.deficit for guild_id, guild in self.guilds.items()}
+        users = {guild_id: collections.deque(guild.users) for guild_id, guild in self.guilds.items()}
+        taken: Dict[Tuple[Hashable, Hashable], int] = collections.Counter()
+
+        while guilds:
+            guild_id = guilds[0]
+            user_id = users[guild_id][0]
+            tickets = self.guilds[guild_id].users[user_id]
+            ticket = tickets[taken[guild_id, user_id]]
+
+            if ticket.cost > deficits[guild_id]:
+                deficits[guild_id] += quantum
+                guilds.rotate(-1)
+                continue
+
+            yield ticket
+            deficits[guild_id] -= ticket.cost
+            taken[guild_id, user_id] += 1
+
+            if taken[guild_id, user_id] < len(tickets):
+                users[guild_id].rotate(-1)
+            else:
+                users[guild_id].popleft()
+
+            if not users[guild_id]:
+                guilds.popleft()
+            else:
+                next_user = users[guild_id][0]
+                if self.guilds[guild_id].users[next_user][taken[guild_id, next_user]].cost > deficits[guild_id]:
+                    deficits[guild_id] += quantum
+                    guilds.rotate(-1)
+
+
+class JobScheduler:
+    """Decides the order jobs start in, so that one busy guild (or user) can't starve everyone else."""
+
+    def __init__(self, lanes: Dict[str, int], max_queue: int, quantum: float) -> None:
+        self.max_queue = max_queue
+        self.quantum = quantum
+
+        # each lane has its own slots, so cheap jobs never wait behind expensive ones
+        self.lanes = {name: _Lane(slots) for name, slots in lanes.items()}
+        self.rejected = 0
+
+    @property
+    def pending(self) -> int:
+        return sum(lane.waiting + lane.running for lane in self.lanes.values())
+
+    def check_capacity(self) -> None:
+        """Raise WorkersBusy if another job wouldn't fit in the queue."""
+
+        if self.pending >= self.max_queue:
+            self.rejected += 1
+            raise WorkersBusy(self.pending)
+
+    def enqueue(self, lane: str, guild: Hashable, user: Hashable, cost: float = 1) -> Ticket:
+        """Queue a job. Await the ticket's wait() before starting it, and release() it when done, whatever happens."""
+
+        self.check_capacity()
+
+        ticket = Ticket(self, lane, guild, user, cost)
+        queue = self.lanes[lane]
+        guild_queue = queue.guilds.setdefault(guild, _GuildQueue(self.quantum))
+        guild_queue.users.setdefault(user, collections.deque()).append(ticket)
+        queue.max_waiting = max(queue.max_waiting, queue.waiting)
+
+        self._dispatch(queue)
+
+        return ticket
+
+    def position(self, ticket: Ticket) -> int:
+        """How many jobs will start before a waiting ticket, if nothing else is queued in the meantime."""
+
+        for position, next_ticket in enumerate(self.lanes[ticket.lane].order(self.quantum)):
+            if next_ticket is ticket:
+                return position
+
+        raise ValueError('ticket is not waiting')
+
+    def release(self, ticket: Ticket) -> None:
+        if ticket.released:
+            return
+        ticket.released = True
+
+        queue = self.lanes[ticket.lane]
+        if ticket.started:
+            queue.running -= 1
+        else:
+            guild_queue = queue.guilds[ticket.guild]
+            tickets = guild_queue.users[ticket.user]
+            tickets.remove(ticket)
+            if not tickets:
+                del guild_queue.users[ticket.user]
+            if not guild_queue.users:
+                del queue.guilds[ticket.guild]
+
+        self._dispatch(queue)
+
+    def _dispatch(self, queue: _Lane) -> None:
+        """Start as many waiting jobs as there are free slots, then let everyone still waiting know."""
+
+        now = time.monotonic()
+        while queue.running < queue.slots and queue.guilds:
+            ticket = queue.pop(self.quantum)
+            ticket.started = True
+            queue.running += 1
+            queue.started += 1
+            queue.total_wait += now - ticket.queued_at
+            ticket._start.set()
+            ticket._moved.set()
+
+        for guild in queue.guilds.values():
+            for tickets in guild.users.values():
+                for ticket in tickets:
+                    ticket._moved.set()
+
+    def stats(self) -> Dict[str, Any]:
+        stats: Dict[str, Any] = {'pending': self.pending, 'max_queue': self.max_queue, 'rejected': self.rejected}
+
+        for name, queue in self.lanes.items():
+            stats.update({
+                f'{name}_running': queue.running,
+                f'{name}_waiting': queue.waiting,
+                f'{name}_max_waiting': queue.max_waiting,
+                f'{name}_guilds_waiting': len(queue.guilds),
+                f'{name}_started': queue.started,
+                f'{name}_mean_wait': round(queue.total_wait / queue.started, 2) if queue.started else 0,
+            })
+
+        return stats
@@ -0,0 +1,143 @@
+import asyncio
+import functools
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from crimsobot.exceptions import WorkersBusy
+
+
+class WorkerPool:
+    """A bounded pool for CPU-heavy work, kept separate from the event loop's default executor."""
+
+    def __init__(self, mode: str, max_workers: int, max_queue: int, initializer: Optional[Callable] = None) -> None:
+        if mode not in ('process', 'thread'):
+            raise ValueError(f'Unknown worker mode {mode}')
+
+        self.mode = mode  # 'thread' is the same interface on top of threads, which is handy for debugging
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.initializer = initializer  # run once in each worker as it starts, e.g. to preload assets
+
+        self.pending = 0  # jobs waiting or running, plus the slots held by reservations
+        self.reserved = 0
+        self.completed = 0
+        self.rejected = 0
+
+        self._executor: Optional[Executor] = None
+
+    @property
+    def executor(self) -> Executor:
+        # created on first use, so merely importing a module that owns a pool doesn't spin up any workers
+        if self._executor is None:
+            if self.mode == 'process':
+                # spawn rather than fork: the bot has threads running (aiohttp, the default executor) that a forked
+                # child would inherit mid-operation
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=self.initializer,
+                )
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix='crimsobot-worker',
+                    initializer=self.initializer,
+                )
+
+        return self._executor
+
+    @property
+    def saturated(self) -> bool:
+        return self.pending >= self.max_queue
+
+    def check_capacity(self, jobs: int = 1) -> None:
+        """Raise WorkersBusy if this many more jobs wouldn't fit. Lets callers bail out before doing anything costly."""
+
+        if self.pending + jobs > self.max_queue:
+            self.rejected += 1
+            raise WorkersBusy(self.pending)
+
+    async def run(self, func: Callable, *args: Any, **kwargs: Any) -> Any:
+        # past max_queue, turn the job away now rather than let everyone's wait grow without bound
+        self.check_capacity()
+
+        return await self.submit(func, *args, **kwargs)
+
+    async def submit(self, func: Callable, *args: Any, **kwargs: Any) -> Any:
+        """Like run(), minus the queue limit, for jobs that must not be turned away."""
+
+        self.pending += 1
+        try:
+            return await self._execute(func, *args, **kwargs)
+        finally:
+            self.pending -= 1
+
+    def reserve(self, jobs: int) -> 'Reservation':
+        """Hold this many slots for a batch of jobs, raising WorkersBusy up front if they aren't all free."""
+
+        self.check_capacity(jobs)
+
+        return Reservation(self, jobs)
+
+    async def _execute(self, func: Callable, *args: Any, **kwargs: Any) -> Any:
+        # in 'process' mode everything passed in and returned is pickled, so pass encoded image bytes, not PIL images
+        loop = asyncio.get_event_loop()
+        try:
+            return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+        finally:
+            self.completed += 1
+
+    async def warm(self) -> None:
+        """Start the workers now, so the first image job doesn't pay for spawning them (and their initializer)."""
+
+        loop = asyncio.get_event_loop()
+        await asyncio.gather(*[loop.run_in_executor(self.executor, _noop) for _ in range(self.max_workers)])
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'mode': self.mode,
+            'workers': self.max_workers,
+            'pending': self.pending,
+            'reserved': self.reserved,
+            'max_queue': self.max_queue,
+            'completed': self.completed,
+            'rejected': self.rejected,
+        }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+class Reservation:
+    """Slots of a WorkerPool held for a batch of jobs, from WorkerPool.reserve() until release()."""
+
+    def __init__(self, pool: WorkerPool, slots: int) -> None:
+        self.pool = pool
+        self.slots = slots
+        self.released = False
+
+        pool.pending += slots
+        pool.reserved += slots
+
+    async def submit(self, func: Callable, *args: Any, **kwargs: Any) -> Any:
+        """Run a job in one of the held slots. No more jobs than there are slots should be out at once."""
+
+        return await self.pool._execute(func, *args, **kwargs)
+
+    def release(self) -> None:
+        """Give the slots back. Safe to call more than once."""
+
+        if self.released:
+            return
+        self.released = True
+
+        self.pool.pending -= self.slots
+        self.pool.reserved -= self.slots
+
+
+def _noop() -> None:
+    # module-level so it can be pickled over to worker processes
+    pass
@@ -0,0 +1,15 @@
+import importlib.util
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# the bot reads its settings from config.py, which isn't checked in; the example's defaults will do for tests
+try:
+    import config  # noqa: F401
+except ImportError:
+    spec = importlib.util.spec_from_file_location('config', os.path.join(ROOT, 'config.example.py'))
+    assert spec is not None and spec.loader is not None
+    sys.modules['config'] = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(sys.modules['config'])
@@ -0,0 +1,103 @@
+import numpy as np
+import pytest
+
+from crimsobot.utils.color import delta_e_cie2000, nearest_colors, rgb_to_lab
+
+color_conversions = pytest.importorskip('colormath.color_conversions')
+color_diff_matrix = pytest.importorskip('colormath.color_diff_matrix')
+color_objects = pytest.importorskip('colormath.color_objects')
+
+# test data from Sharma, Wu & Dalal (2005): Lab 1, Lab 2, CIEDE2000
+SHARMA_PAIRS = [
+    ((50.0000, 2.6772, -79.7751), (50.0000, 0.0000, -82.7485), 2.0425),
+    ((50.0000, 3.1571, -77.2803), (50.0000, 0.0000, -82.7485), 2.8615),
+    ((50.0000, 2.8361, -74.0200), (50.0000, 0.0000, -82.7485), 3.4412),
+    ((50.0000, -1.3802, -84.2814), (50.0000, 0.0000, -82.7485), 1.0000),
+    ((50.0000, -1.1848, -84.8006), (50.0000, 0.0000, -82.7485), 1.0000),
+    ((50.0000, -0.9009, -85.5211), (50.0000, 0.0000, -82.7485), 1.0000),
+    ((50.0000, 0.0000, 0.0000), (50.0000, -1.0000, 2.0000), 2.3669),
+    ((50.0000, -1.0000, 2.0000), (50.0000, 0.0000, 0.0000), 2.3669),
+    ((50.0000, 2.4900, -0.0010), (50.0000, -2.4900, 0.0009), 7.1792),
+    ((50.0000, 2.4900, -0.0010), (50.0000, -2.4900, 0.0010), 7.1792),
+    ((50.0000, 2.4900, -0.0010), (50.0000, -2.4900, 0.0011), 7.2195),
+    ((50.0000, 2.4900, -0.0010), (50.0000, -2.4900, 0.0012), 7.2195),
+    ((50.0000, -0.0010, 2.4900), (50.0000, 0.0009, -2.4900), 4.8045),
+    ((50.0000, -0.0010, 2.4900), (50.0000, 0.0010, -2.4900), 4.8045),
+    ((50.0000, -0.0010, 2.4900), (50.0000, 0.0011, -2.4900), 4.7461),
+    ((50.0000, 2.5000, 0.0000), (50.0000, 0.0000, -2.5000), 4.3065),
+    ((50.0000, 2.5000, 0.0000), (73.0000, 25.0000, -18.0000), 27.1492),
+    ((50.0000, 2.5000, 0.0000), (61.0000, -5.0000, 29.0000), 22.8977),
+    ((50.0000, 2.5000, 0.0000), (56.0000, -27.0000, -3.0000), 31.9030),
+    ((50.0000, 2.5000, 0.0000), (58.0000, 24.0000, 15.0000), 19.4535),
+    ((50.0000, 2.5000, 0.0000), (50.0000, 3.1736, 0.5854), 1.0000),
+    ((50.0000, 2.5000, 0.0000), (50.0000, 3.2972, 0.0000), 1.0000),
+    ((50.0000, 2.5000, 0.0000), (50.0000, 1.8634, 0.5757), 1.0000),
+    ((50.0000, 2.5000, 0.0000), (50.0000, 3.2592, 0.3350), 1.0000),
+    ((60.2574, -34.0099, 36.2677), (60.4626, -34.1751, 39.4387), 1.2644),
+    ((63.0109, -31.0961, -5.8663), (62.8187, -29.7946, -4.0864), 1.2630),
+    ((61.2901, 3.7196, -5.3901), (61.4292, 2.2480, -4.9620), 1.8731),
+    ((35.0831, -44.1164, 3.7933), (35.0232, -40.0716, 1.5901), 1.8645),
+    ((22.7233, 20.0904, -46.6940), (23.0331, 14.9730, -42.5619), 2.0373),
+    ((36.4612, 47.8580, 18.3852), (36.2715, 50.5065, 21.2231), 1.4146),
+    ((90.8027, -2.0831, 1.4410), (91.1528, -1.6435, 0.0447), 1.4441),
+    ((90.9257, -0.5406, -0.9208), (88.6381, -0.8985, -0.7239), 1.5381),
+    ((6.7747, -0.2908, -2.4247), (5.8714, -0.0985, -2.2286), 0.6377),
+    ((2.0776, 0.0795, -1.1350), (0.9033, -0.0636, -0.5514), 0.9082),
+]
+
+
+def reference_lab(rgb: np.ndarray) -> np.ndarray:
+    return np.array([
+        color_conversions.convert_color(color_objects.sRGBColor(*color, is_upscaled=True), color_objects.LabColor)
+        .get_value_tuple() for color in rgb
+    ])
+
+
+def hue_sum_wraps(lab_1: np.ndarray, lab_2: np.ndarray) -> np.ndarray:
+    """Pairs whose mean hue is taken across 0 and whose hues add up to 360 or more."""
+
+    c_mean = (np.hypot(lab_1[..., 1], lab_1[..., 2]) + np.hypot(lab_2[..., 1], lab_2[..., 2])) / 2
+    g = 0.5 * (1 - np.sqrt(c_mean ** 7 / (c_mean ** 7 + 25 ** 7)))
+    h_1 = np.degrees(np.arctan2(lab_1[..., 2], (1 + g) * lab_1[..., 1])) % 360
+    h_2 = np.degrees(np.arctan2(lab_2[..., 2], (1 + g) * lab_2[..., 1])) % 360
+
+    return (np.abs(h_1 - h_2) > 180) & (h_1 + h_2 >= 360)  # type: ignore[no-any-return]
+
+
+@pytest.fixture
+def rgb() -> np.ndarray:
+    colors = np.random.default_rng(0).integers(0, 256, (300, 3))
+
+    # grays and the corners of the cube are where hue and chroma terms get degenerate
+    extremes = [[0, 0, 0], [255, 255, 255], [128, 128, 128], [255, 0, 0], [0, 255, 0], [0, 0, 255], [1, 1, 1]]
+
+    return np.concatenate([colors, extremes])  # type: ignore[no-any-return]
+
+
+def test_rgb_to_lab_matches_colormath(rgb: np.ndarray) -> None:
+    np.testing.assert_allclose(rgb_to_lab(rgb), reference_lab(rgb), atol=1e-6)
+
+
+def test_delta_e_matches_sharma() -> None:
+    lab_1, lab_2, expected = (np.array(column) for column in zip(*SHARMA_PAIRS))
+
+    np.testing.assert_allclose(delta_e_cie2000(lab_1, lab_2), expected, atol=5e-5)
+    np.testing.assert_allclose(delta_e_cie2000(lab_2, lab_1), expected, atol=5e-5)
+
+
+def test_delta_e_matches_colormath(rgb: np.ndarray) -> None:
+    lab = reference_lab(rgb)
+
+    for color in lab:
+        # colormath doesn't take 360 back off the mean hue when the hues add up past it, which the Sharma pairs cover
+        same = ~hue_sum_wraps(color, lab)
+        expected = color_diff_matrix.delta_e_cie2000(color, lab)
+        np.testing.assert_allclose(delta_e_cie2000(color, lab)[same], expected[same], atol=1e-9)
+
+
+def test_nearest_colors_matches_exhaustive_search(rgb: np.ndarray) -> None:
+    lab = rgb_to_lab(rgb)
+    palette = lab[:16]
+
+    expected = [int(np.argmin([delta_e_cie2000(color, entry) for entry in palette])) for color in lab]
+    assert nearest_colors(lab, palette).tolist() == expected
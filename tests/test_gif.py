@@ -0,0 +1,117 @@
+import pickle
+from io import BytesIO
+from typing import List, Tuple
+
+import numpy as np
+import pytest
+from PIL import Image, ImageSequence
+
+from crimsobot.utils import gif
+
+WIDTH, HEIGHT = 80, 60
+
+
+def make_frames(n_frames: int) -> List[Image.Image]:
+    """A sprite moving over a noisy background with a hole in it, a scene cut halfway and some fully opaque frames."""
+
+    rng = np.random.default_rng(0)
+    background = rng.integers(0, 256, (HEIGHT, WIDTH, 3), dtype=np.uint8)
+
+    frames = []
+    for i in range(n_frames):
+        rgba = np.full((HEIGHT, WIDTH, 4), 255, dtype=np.uint8)
+        rgba[..., :3] = background if i < n_frames // 2 else 255 - background
+        if i % 5 != 4:
+            rgba[10:30, :40, 3] = 0
+        x = i * 3 % (WIDTH - 15)
+        rgba[30:45, x:x + 15, :3] = [255, 0, 0]
+        frames.append(Image.fromarray(rgba, 'RGBA'))
+
+    return frames
+
+
+def quantize(frames: List[Image.Image], duration: int = 50) -> List[Tuple[Image.Image, int]]:
+    return list(gif.Quantizer(8).stream((frame, duration) for frame in frames))
+
+
+def write(quantized: List[Tuple[Image.Image, int]], loops: bool = True) -> bytes:
+    fp = BytesIO()
+    writer = gif.GifWriter(fp, loops)
+    for frame, duration in quantized:
+        writer.add(frame, duration)
+    writer.close()
+
+    return fp.getvalue()
+
+
+def as_shown(frame: Image.Image) -> Tuple[np.ndarray, np.ndarray]:
+    """(RGB, transparency mask) of a frame as it's meant to be displayed."""
+
+    if frame.mode == 'P':
+        return np.asarray(frame.convert('RGB')), np.asarray(frame) == gif.TRANSPARENT
+
+    rgba = np.asarray(frame.convert('RGBA'))
+    return rgba[..., :3], rgba[..., 3] == 0
+
+
+@pytest.mark.parametrize('frame_delta', [True, False])
+def test_round_trip(monkeypatch: pytest.MonkeyPatch, frame_delta: bool) -> None:
+    monkeypatch.setitem(gif.GIF_RULES, 'frame_delta', frame_delta)
+    quantized = quantize(make_frames(20))
+
+    decoded = Image.open(BytesIO(write(quantized)))
+
+    assert decoded.n_frames == len(quantized)
+    assert decoded.info['loop'] == 0
+    for (frame, duration), shown in zip(quantized, ImageSequence.Iterator(decoded)):
+        assert shown.info['duration'] == duration
+
+        expected_rgb, expected_clear = as_shown(frame)
+        rgb, clear = as_shown(shown)
+        np.testing.assert_array_equal(clear, expected_clear)
+        np.testing.assert_array_equal(rgb[~clear], expected_rgb[~clear])
+
+
+def test_shared_palette_about_as_close_as_per_frame() -> None:
+    frames = make_frames(20)
+
+    for original, (frame, _) in zip(frames, quantize(frames)):
+        original_rgb, original_clear = as_shown(original)
+        rgb, clear = as_shown(frame)
+        per_frame = np.asarray(original.convert('RGB').quantize(255).convert('RGB'))
+
+        np.testing.assert_array_equal(clear, original_clear)
+        error = np.abs(rgb.astype(int) - original_rgb)[~clear].mean()
+        assert error <= 1.1 * np.abs(per_frame.astype(int) - original_rgb)[~clear].mean()
+
+
+def test_identical_frames_are_merged() -> None:
+    frames = make_frames(6)
+    frames[3] = frames[2].copy()
+
+    decoded = Image.open(BytesIO(write(quantize(frames))))
+
+    durations = [frame.info['duration'] for frame in ImageSequence.Iterator(decoded)]
+    assert durations == [50, 50, 100, 50, 50]
+
+
+def test_still_loops_flag() -> None:
+    decoded = Image.open(BytesIO(write(quantize(make_frames(3)), loops=False)))
+
+    assert 'loop' not in decoded.info
+
+
+def test_writer_picks_up_where_it_left_off_after_pickling() -> None:
+    quantized = quantize(make_frames(20))
+
+    writer = gif.GifWriter(BytesIO(), True)
+    pieces = []
+    for start in range(0, len(quantized), 6):
+        for frame, duration in quantized[start:start + 6]:
+            writer.add(frame, duration)
+        pieces.append(writer.take_output())
+        writer = pickle.loads(pickle.dumps(writer))  # as if the next chunk were encoded in another worker
+    writer.close()
+    pieces.append(writer.take_output())
+
+    assert b''.join(pieces) == write(quantized)
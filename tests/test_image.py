@@ -0,0 +1,97 @@
+import asyncio
+from io import BytesIO
+from typing import Iterator, List, Optional
+
+import numpy as np
+import pytest
+from PIL import Image, ImageSequence
+
+from crimsobot.utils import image
+from crimsobot.utils.image import GifFrameCounter, box_sum
+from crimsobot.utils.workers import WorkerPool
+
+
+def make_gif(n_frames: int, width: int = 80, height: int = 60) -> bytes:
+    rng = np.random.default_rng(0)
+
+    y, x = np.mgrid[:height, :width]
+    background = np.stack([x * 255 // width, y * 255 // height, (x + y) * 255 // (width + height)], axis=-1)
+
+    frames = []
+    for i in range(n_frames):
+        rgba = np.full((height, width, 4), 255, dtype=np.uint8)
+        rgba[..., :3] = np.roll(background, i, axis=1)
+        rgba[:height // 3, :width // 2, 3] = 0
+        x = i * 3 % (width - 15)
+        rgba[height // 2:height // 2 + 15, x:x + 15, :3] = rng.integers(0, 256, (15, 15, 3), dtype=np.uint8)
+        frames.append(Image.fromarray(rgba, 'RGBA'))
+
+    fp = BytesIO()
+    frames[0].save(fp, 'GIF', save_all=True, append_images=frames[1:], duration=40, loop=0, disposal=2)
+    return fp.getvalue()
+
+
+def decode(gif_bytes: bytes) -> List[np.ndarray]:
+    frames = ImageSequence.Iterator(Image.open(BytesIO(gif_bytes)))
+    return [np.asarray(frame.convert('RGBA')).astype(int) for frame in frames]
+
+
+def durations(gif_bytes: bytes) -> List[int]:
+    return [frame.info['duration'] for frame in ImageSequence.Iterator(Image.open(BytesIO(gif_bytes)))]
+
+
+@pytest.fixture
+def thread_pool(monkeypatch: pytest.MonkeyPatch) -> Iterator[WorkerPool]:
+    pool = WorkerPool('thread', 2, 8)
+    monkeypatch.setattr(image, 'image_pool', pool)
+
+    yield pool
+
+    pool.shutdown()
+
+
+@pytest.mark.parametrize('size', [1, 2, 3, 4, 7, 10])
+def test_box_sum_matches_convolve2d(size: int) -> None:
+    signal = pytest.importorskip('scipy.signal')
+    raster = np.random.default_rng(size).integers(0, 256, (23, 31, 3))
+
+    summed = box_sum(raster, size)
+
+    kernel = np.ones((size, size))
+    for channel in range(3):
+        expected = signal.convolve2d(raster[..., channel], kernel, mode='same', boundary='symm')
+        np.testing.assert_array_equal(summed[..., channel], expected)
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 100, 4096, None])
+def test_frame_counter_counts_as_it_downloads(chunk_size: Optional[int]) -> None:
+    gif_bytes = make_gif(37)
+    step = chunk_size or len(gif_bytes)
+
+    counter = GifFrameCounter()
+    received = bytearray()
+    counts = []
+    for start in range(0, len(gif_bytes), step):
+        received.extend(gif_bytes[start:start + step])
+        counts.append(counter.feed(received))
+
+    assert counts[-1] == Image.open(BytesIO(gif_bytes)).n_frames == 37
+    assert counts == sorted(counts)
+
+
+@pytest.mark.parametrize('effect, arg', [('acid', 2), ('needban', None), ('caption', ['hello'])])
+def test_parallel_render_matches_serial(thread_pool: WorkerPool, effect: str, arg: object) -> None:
+    gif_bytes = make_gif(30)
+
+    serial = image.render_image(gif_bytes, effect, arg)
+    parallel, _ = asyncio.run(image.render_image_parallel(gif_bytes, effect, arg))
+
+    # chunks after the first start out with its palette rather than carrying one on, so colors can differ slightly
+    assert durations(parallel) == durations(serial)
+    assert Image.open(BytesIO(parallel)).info.get('loop') == Image.open(BytesIO(serial)).info.get('loop')
+    for serial_frame, parallel_frame in zip(decode(serial), decode(parallel)):
+        clear = serial_frame[..., 3] == 0
+        np.testing.assert_array_equal(parallel_frame[..., 3] == 0, clear)
+        assert np.abs(parallel_frame - serial_frame)[..., :3][~clear].mean() < 8
+
+    assert thread_pool.pending == thread_pool.reserved == 0
@@ -0,0 +1,67 @@
+import random
+from typing import Dict, List, Tuple, Type
+
+import markovify
+import pytest
+
+from crimsobot.utils.markov import fold_text
+
+WORDS = 'the a crimso bot says wow hello there friend big little cat dog runs eats sleeps over under'.split()
+
+
+def corpus_lines(seed: int, n_lines: int) -> List[str]:
+    rng = random.Random(seed)
+    return [' '.join(rng.choice(WORDS) for _ in range(rng.randint(3, 12))).capitalize() + '.' for _ in range(n_lines)]
+
+
+def counts(chain: markovify.Chain) -> Dict[Tuple[str, ...], Dict[str, int]]:
+    """A compiled chain's transitions as plain counts, which don't depend on the order choices were added in."""
+
+    decompiled = {}  # type: Dict[Tuple[str, ...], Dict[str, int]]
+    for state, (choices, cumulative) in chain.model.items():
+        previous = 0
+        decompiled[state] = {}
+        for choice, total in zip(choices, cumulative):
+            decompiled[state][choice] = total - previous
+            previous = total
+
+    return decompiled
+
+
+@pytest.mark.parametrize('model_type, join, state_size, retain_original', [
+    (markovify.NewlineText, '\n', 2, False),  # like crimso
+    (markovify.Text, ' ', 3, True),  # like rovin and wisdom
+    (markovify.Text, ' ', 1, True),
+])
+def test_fold_text_matches_full_rebuild(model_type: Type[markovify.Text], join: str, state_size: int,
+                                        retain_original: bool) -> None:
+    base, added = join.join(corpus_lines(1, 400)), join.join(corpus_lines(2, 50))
+
+    model = model_type(base, state_size=state_size, retain_original=retain_original).compile(inplace=True)
+    assert fold_text(model, added) == 50
+
+    rebuilt = model_type(base + join + added, state_size=state_size, retain_original=retain_original)
+    rebuilt.compile(inplace=True)
+
+    assert counts(model.chain) == counts(rebuilt.chain)
+    if retain_original:
+        assert model.parsed_sentences == rebuilt.parsed_sentences
+        assert model.rejoined_text == rebuilt.rejoined_text
+
+
+def test_fold_text_reaches_new_states() -> None:
+    model = markovify.NewlineText('\n'.join(corpus_lines(1, 100)), state_size=2, retain_original=False)
+    model.compile(inplace=True)
+
+    fold_text(model, 'Zebras juggle quietly tonight.')
+
+    assert model.make_sentence_with_start('Zebras juggle', strict=True, tries=100) is not None
+
+
+def test_fold_text_ignores_empty_text() -> None:
+    model = markovify.NewlineText('\n'.join(corpus_lines(1, 100)), state_size=2, retain_original=False)
+    model.compile(inplace=True)
+    before = counts(model.chain)
+
+    assert fold_text(model, '') == 0
+    assert counts(model.chain) == before
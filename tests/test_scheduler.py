@@ -0,0 +1,103 @@
+import asyncio
+from typing import Hashable, List, Sequence, Tuple
+
+import pytest
+
+from crimsobot.exceptions import WorkersBusy
+from crimsobot.utils.scheduler import JobScheduler, Ticket
+
+
+def start_order(tickets: List[Ticket]) -> List[Ticket]:
+    """Finish the running job until every ticket has started, and return them in the order they did."""
+
+    order = [ticket for ticket in tickets if ticket.started]
+    while len(order) < len(tickets):
+        running = [ticket for ticket in order if not ticket.released]
+        running[0].release()
+        order.extend(ticket for ticket in tickets if ticket.started and ticket not in order)
+
+    return order
+
+
+def enqueue_all(scheduler: JobScheduler, jobs: Sequence[Tuple[Hashable, Hashable, float]]) -> List[Ticket]:
+    return [scheduler.enqueue('slow', guild, user, cost) for guild, user, cost in jobs]
+
+
+def test_position_predicts_start_order() -> None:
+    async def test() -> None:
+        scheduler = JobScheduler({'slow': 1}, 100, 50)
+        guilds = [1, 1, 2, 1, 3, 2, 1, 3, 3, 2, 1, 1]
+        users = [1, 2, 1, 1, 1, 2, 3, 1, 2, 1, 1, 2]
+        tickets = enqueue_all(scheduler, list(zip(guilds, users, [1, 300, 10, 40, 100, 1] * 2)))
+
+        waiting = [ticket for ticket in tickets if not ticket.started]
+        positions = {ticket: ticket.position for ticket in waiting}
+        order = [ticket for ticket in start_order(tickets) if ticket in positions]
+
+        assert [positions[ticket] for ticket in order] == list(range(len(waiting)))
+
+    asyncio.run(test())
+
+
+def test_a_flooding_guild_does_not_hold_up_others() -> None:
+    async def test() -> None:
+        scheduler = JobScheduler({'slow': 1}, 100, 1)
+        flood = enqueue_all(scheduler, [('flood', 'user', 1)] * 10)
+        others = enqueue_all(scheduler, [('other', 'user', 1), ('another', 'user', 1)])
+
+        order = start_order(flood + others)
+
+        assert {order.index(ticket) for ticket in others} <= set(range(4))
+
+    asyncio.run(test())
+
+
+def test_guilds_get_equal_shares_of_work() -> None:
+    async def test() -> None:
+        scheduler = JobScheduler({'slow': 1}, 200, 50)
+        big = enqueue_all(scheduler, [('big', 'user', 100)] * 10)
+        small = enqueue_all(scheduler, [('small', 'user', 10)] * 100)
+
+        order = start_order(big + small)
+
+        # while both guilds have work waiting, neither gets more than a turn and a job ahead of the other
+        gap = 0.0
+        for ticket in order[:-1]:
+            gap += ticket.cost if ticket in big else -ticket.cost
+            assert abs(gap) <= 50 + 100
+
+    asyncio.run(test())
+
+
+def test_users_in_a_guild_take_turns() -> None:
+    async def test() -> None:
+        scheduler = JobScheduler({'slow': 1}, 100, 50)
+        tickets = enqueue_all(scheduler, [('guild', 'a', 1)] * 3 + [('guild', 'b', 1)] * 3)
+
+        order = start_order(tickets)
+
+        assert [ticket.user for ticket in order] == ['a', 'a', 'b', 'a', 'b', 'b']
+
+    asyncio.run(test())
+
+
+def test_queue_limit() -> None:
+    async def test() -> None:
+        scheduler = JobScheduler({'slow': 1, 'fast': 1}, 3, 50)
+        running = scheduler.enqueue('slow', 1, 1)
+        waiting = scheduler.enqueue('slow', 1, 1)
+        scheduler.enqueue('fast', 1, 1)
+
+        with pytest.raises(WorkersBusy):
+            scheduler.enqueue('fast', 2, 2)
+        assert scheduler.rejected == 1
+
+        waiting.release()
+        waiting.release()
+        assert scheduler.pending == 2
+        scheduler.enqueue('slow', 2, 2)
+
+        running.release()
+        assert scheduler.stats()['slow_running'] == 1
+
+    asyncio.run(test())